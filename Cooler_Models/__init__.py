@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Cooler and house models as an importable package.
+
+    from Cooler_Models import final_model, cooler_model as cm
+
+The building blocks live in the libs subpackage and are also reachable
+from here by name. Scripts are run as modules from the directory holding
+the package, e.g. python -m Cooler_Models.final_model or
+python -m Cooler_Models.libs.backtest.
+
+Nothing is imported up front: the models and the libs modules are loaded
+the first time they are used, and pandas only when a data frame is
+actually built (ForecastResult.to_frame), so importing the package for
+the control loop costs little more than numpy.
+"""
+
+import importlib
+
+# modules of the package, loaded on first access
+_MODELS = ('final_model', 'house_model', 'sweep')
+_LIBS = ('cooler_model', 'Environment', 'simulation', 'outlet_table', 'planner',
+         'planner_cache', 'nws_forecast', 'calibration', 'forecast_ensemble',
+         'integrator', 'thermal_model', 'policy_table', 'backtest', 'site_model',
+         'profiling', 'lite_model', 'decision_service')
+
+__all__ = list(_MODELS + _LIBS)
+
+
+def __getattr__(name):
+    if name in _MODELS:
+        module = importlib.import_module('.' + name, __name__)
+    elif name in _LIBS:
+        module = importlib.import_module('.libs.' + name, __name__)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = module
+    return module
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Cold import time of the controller modules.
+
+Each module is imported in a fresh interpreter several times and the best
+time is compared with startup_baseline.json. The run fails (exit status 1)
+when a module got slower than baseline * (1 + tolerance), or when it pulls
+in one of the heavy optional dependencies at import time.
+
+    python benchmarks/startup.py            check against the baseline
+    python benchmarks/startup.py --update   record a new baseline
+
+The baseline holds absolute timings of the machine that wrote it. Run
+--update once on the target device (the Raspberry Pi) before relying on
+the check there, the committed file only fits the development machine.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+BASELINE = os.path.join(HERE, 'startup_baseline.json')
+
+MODULES = ('final_model', 'house_model', 'simulation', 'cooler_model')
+# must not be loaded just by importing the models
+HEAVY = ('pandas', 'scipy', 'matplotlib')
+
+_PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+from Cooler_Models import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed,
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def cold_import(module, repeat = 5):
+    ''' best of repeat fresh interpreter imports, (seconds, heavy modules) '''
+    best, heavy = None, []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY)],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        heavy = result['heavy']
+        best = result['seconds'] if best is None else min(best, result['seconds'])
+    return best, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cold import time check')
+    parser.add_argument('--update', action='store_true', help='write a new baseline')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed relative slow down')
+    args = parser.parse_args(argv)
+
+    timings = {}
+    failed = False
+    for module in MODULES:
+        seconds, heavy = cold_import(module, args.repeat)
+        timings[module] = seconds
+        if heavy:
+            print('{}: imports {} at startup'.format(module, ', '.join(heavy)))
+            failed = True
+
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump({m: round(s, 4) for m, s in timings.items()}, f, indent=4, sort_keys=True)
+        print('baseline written to ' + BASELINE)
+        return 1 if failed else 0
+
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    for module, seconds in timings.items():
+        limit = baseline.get(module, seconds) * (1 + args.tolerance)
+        status = 'ok' if seconds <= limit else 'SLOWER'
+        print('{:14s} {:7.3f} s  (limit {:.3f} s)  {}'.format(module, seconds, limit, status))
+        failed |= seconds > limit
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
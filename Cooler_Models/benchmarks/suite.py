@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the cooler model, Environment stepping and the
+forecast / mode selection pipeline.
+
+Every benchmark is timed (best of several repeats) and every numerical
+check produces values that are compared with suite_baseline.json, so both
+slow downs and changed results are caught. The outlet temperatures are
+also compared with the reference chart in cooler_table.csv.
+
+    python benchmarks/suite.py                     check, report on stdout
+    python benchmarks/suite.py -o report.json      also write a json report
+    python benchmarks/suite.py --update            record a new baseline
+
+The exit status is 1 when anything regressed. The baseline timings are
+absolute and only fit the machine that recorded them: run --update on the
+target device (e.g. the Pi) first, the numerical values carry over.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# run as a script: make the package importable from its parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(HERE)))
+
+import numpy as np
+from Cooler_Models import cooler_model as cm, final_model, simulation as sim
+from Cooler_Models import Environment as env
+
+Environment, EnvironmentEnsemble = env.Environment, env.EnvironmentEnsemble
+
+BASELINE = os.path.join(HERE, 'suite_baseline.json')
+COOLER_TABLE = os.path.join(os.path.dirname(HERE), 'cooler_table.csv')
+
+T_AMBIENT  = [300.0, 302.3, 304.5, 306.4, 307.8, 308.7, 309.0, 308.7, 307.8, 306.4, 304.5, 302.3,
+              300.0, 297.7, 295.5, 293.6, 292.2, 291.3, 291.0, 291.3, 292.2, 293.6, 295.5, 297.7, 300.0]
+RH_AMBIENT = [25, 25, 25, 25, 25, 25, 25, 26, 27, 28, 29, 30, 31, 29, 27, 27, 27, 27, 27, 27, 27,
+              27, 27, 27, 27]
+MODES = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+
+
+def _points(n = 10000):
+    rng = np.random.default_rng(0)
+    return rng.uniform(20, 50, n), rng.uniform(2, 80, n)
+
+
+# --- timings, each returns the callable to time ----------------------------
+
+def bench_outlet_scalar():
+    t, rh = _points(1000)
+    return lambda: [cm.calculate_outlet_temp(a, b, 0.75) for a, b in zip(t, rh)]
+
+
+def bench_outlet_batch():
+    t, rh = _points(1000)
+    return lambda: cm.calculate_outlet_temp_batch(t, rh, 0.75)
+
+
+def bench_environment_loop():
+    def run():
+        house, exhaust = Environment(80, 25, 10000), Environment(70, 35, 1000)
+        for i in range(1000):
+            house.remove(exhaust.vol)
+            house.mix(exhaust)
+    return run
+
+
+def bench_environment_advance():
+    def run():
+        Environment(80, 25, 10000).advance(Environment(70, 35, 1000), 1000)
+    return run
+
+
+def bench_ensemble_1000_zones():
+    def run():
+        houses = EnvironmentEnsemble(np.linspace(75, 90, 1000), 25, 10000)
+        exhaust = EnvironmentEnsemble(70, 35, np.linspace(0, 1000, 1000))
+        for i in range(100):
+            houses.remove(exhaust.vol)
+            houses.mix(exhaust)
+    return run
+
+
+def _forecast(steps):
+    return lambda: final_model.forecast_inside_conditions_fast(
+        steps, 2, 1, T_AMBIENT, RH_AMBIENT, 305, 30, (0, 70, 106), 10000, dt=15)
+
+
+def bench_forecast_1_hour():
+    return _forecast(4)
+
+
+def bench_forecast_1_day():
+    return _forecast(96)
+
+
+def bench_forecast_1_week():
+    return _forecast(672)
+
+
+def bench_get_auto_setting():
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            final_model.get_auto_setting()
+    return run
+
+
+# --- numerical checks, each returns a list of floats ----------------------
+
+def check_outlet_table():
+    ''' model outlet temperatures F on the cooler_table.csv grid '''
+    rhs, temps, _ = read_cooler_table()
+    t, rh = np.meshgrid(cm.f2c(np.array(temps, dtype=float)), rhs, indexing='ij')
+    return cm.c2f(cm.calculate_outlet_temp_batch(t, rh, 0.75)[0]).ravel().tolist()
+
+
+def check_forecast_week():
+    return final_model.forecast_inside_conditions_fast(
+        672, 2, 1, T_AMBIENT, RH_AMBIENT, 305, 30, (0, 70, 106), 10000).T_house[::24].tolist()
+
+
+def check_mode_scores():
+    _, scores = final_model.score_modes(MODES, 4, T_AMBIENT, RH_AMBIENT, 305, 30,
+                                        (0, 70, 106), 10000, cm.c2k(cm.f2c(75)))
+    return scores.tolist()
+
+
+def check_environment_steps():
+    house = Environment(80, 25, 10000)
+    house.advance(Environment(70, 35, 1000), 20)
+    return [house.tem, house.rh]
+
+
+def read_cooler_table():
+    ''' (rh columns, temperature rows, chart values F with None for "-") '''
+    with open(COOLER_TABLE) as f:
+        rows = list(csv.reader(f, delimiter='\t'))
+    rhs = [float(x) for x in rows[0][1:] if x]
+    temps = [float(r[0]) for r in rows[1:] if r]
+    values = [[None if x.strip() == '-' else float(x) for x in r[1:len(rhs)+1]]
+              for r in rows[1:] if r]
+    return rhs, temps, values
+
+
+def chart_deviation():
+    ''' max and mean |model - chart| F over the cells the chart fills in '''
+    _, _, chart = read_cooler_table()
+    model = np.array(check_outlet_table()).reshape(len(chart), -1)
+    chart = np.array([[np.nan if v is None else v for v in row] for row in chart])
+    diff = abs(model - chart)
+    return [float(np.nanmax(diff)), float(np.nanmean(diff))]
+
+
+BENCHMARKS = {name[len('bench_'):]: f for name, f in sorted(globals().items())
+              if name.startswith('bench_')}
+CHECKS = {name[len('check_'):]: f for name, f in sorted(globals().items())
+          if name.startswith('check_')}
+
+
+def run(repeat = 5):
+    timings = {}
+    for name, setup in BENCHMARKS.items():
+        func = setup()
+        number, _ = timeit.Timer(func).autorange()
+        timings[name] = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    values = {name: check() for name, check in CHECKS.items()}
+    values['chart_deviation'] = chart_deviation()
+    return timings, values
+
+
+def compare(timings, values, baseline, speed_tolerance, rtol):
+    ''' list of (kind, name, message) regressions '''
+    problems = []
+    for name, seconds in timings.items():
+        reference = baseline['timings'].get(name)
+        if reference is not None and seconds > reference * (1 + speed_tolerance):
+            problems.append(('speed', name, '{:.3g} s vs baseline {:.3g} s'.format(seconds, reference)))
+    for name, result in values.items():
+        reference = baseline['values'].get(name)
+        if reference is None:
+            continue
+        if name == 'chart_deviation':
+            # may get closer to the chart, not further away
+            if result[0] > reference[0] + 1e-9 or result[1] > reference[1] + 1e-9:
+                problems.append(('numeric', name, 'deviation {} vs baseline {}'.format(result, reference)))
+        elif len(result) != len(reference) or \
+             not np.allclose(result, reference, rtol=rtol, atol=0, equal_nan=True):
+            problems.append(('numeric', name, 'values differ from baseline'))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cooler model benchmark suite')
+    parser.add_argument('--update', action='store_true', help='write a new baseline')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--speed-tolerance', type=float, default=0.5,
+                        help='allowed relative slow down')
+    parser.add_argument('--rtol', type=float, default=1e-9,
+                        help='allowed relative change of numerical results')
+    parser.add_argument('-o', '--output', help='json report file')
+    args = parser.parse_args(argv)
+
+    timings, values = run(args.repeat)
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump({'timings': timings, 'values': values}, f, indent=1, sort_keys=True)
+        print('baseline written to ' + BASELINE)
+        return 0
+
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    problems = compare(timings, values, baseline, args.speed_tolerance, args.rtol)
+    for name, seconds in timings.items():
+        reference = baseline['timings'].get(name)
+        print('{:24s} {:10.3g} s  baseline {:10.3g} s'.format(name, seconds, reference or float('nan')))
+    print('chart deviation max {:.2f} F mean {:.2f} F'.format(*values['chart_deviation']))
+    for kind, name, message in problems:
+        print('REGRESSION {} {}: {}'.format(kind, name, message))
+
+    if args.output:
+        report = {'python': platform.python_version(), 'machine': platform.machine(),
+                  'timings': timings, 'baseline_timings': baseline['timings'],
+                  'chart_deviation': values['chart_deviation'],
+                  'regressions': [{'kind': k, 'name': n, 'message': m} for k, n, m in problems]}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,24 +5,27 @@ Created on Sat Jan 16 14:05:03 2021
 @author: rjensen, jlimondo
 """
 
-import os, sys
-
-local_module_path=os.path.join(os.path.dirname(os.path.abspath(__file__)),'libs')
-print(local_module_path)
-sys.path.append(local_module_path)
-
 #from cooler_model import *
-import cooler_model as cm
-from Environment import Environment
+from .libs import cooler_model as cm
+from .libs import simulation as sim
+from .libs.profiling import profiled
 import numpy as np
-import pandas as pd
 
-def get_auto_setting():
+@profiled
+def get_auto_setting(modes=None, water_weight=0.0, energy_weight=0.0, site=None):
     '''Inside and outside temperatures are obtained, 
     a simulation is then run in each of the five operating modes to determine
     the most suitable mode for operation. 
     The 'Pump' mode is not considered because it is the same as 'Off'.
-    The most suitable mode is returned to the controller.'''
+    The most suitable mode is returned to the controller.
+    modes - optional mode table (see simulation.mode_settings), defaults
+    to simulation.MODES.
+    water_weight, energy_weight - cost per kg of water and per kWh added
+    to each mode's score (see score_modes), 0 scores comfort only.
+    site - optional site_model.Site, station pressure for the cooler
+    psychrometrics and the air density.
+    The temperatures are kelvin and go to score_modes with kelvin=True,
+    so the cooler correlations see celcius.'''
     
     # get outside temperature and RH
     # for now, just hard code something, note: temperature in Kelvin here
@@ -32,6 +35,8 @@ def get_auto_setting():
     rh_house = 30
 
     rho_air = 0.00238 # slug/ft**3 (sea level)
+    if site is not None:
+        rho_air = rho_air * site.density_ratio()
 
     # get settings
     # Cooler parameters:
@@ -43,40 +48,65 @@ def get_auto_setting():
     house_vol = 10000 #ft**3
     desired_temp = cm.c2k( cm.f2c( 75 ) ) # kelvin
     
-    modes={
-        'Off':            {'fan':0, 'pump':0},
-        'Fan Hi':         {'fan':2, 'pump':0},
-        'Fan Lo':         {'fan':1, 'pump':0},
-        'Fan Hi (w/Pump)':{'fan':2, 'pump':1},
-        'Fan Lo (w/Pump)':{'fan':1, 'pump':1},
-        'Pump':           {'fan':0, 'pump':1}
-    }
-    
-    # loop over modes
-    best_mode = 'Off'
-    best_score = 99999
-    for mode in modes:
-        if mode == 'Pump': break
-        print(mode, T_house, rh_house)
-        result=forecast_inside_conditions(4, 
-                                   modes[mode]['fan'], modes[mode]['pump'],
-                                   T_ambient, rh_ambient,
-                                   T_house, rh_house, v_dot_air, house_vol
-                                   )
-        score = sum((result.T_house - desired_temp )**2)
-        print( (result.T_house - desired_temp )**2)
-        print(score)
-        if score < best_score:
-            best_score = score
-            best_mode = mode
-    
-    # score and return result
-
-    return best_mode
+    if modes is None:
+        modes = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+
+    names, scores = score_modes(modes, 4, T_ambient, rh_ambient,
+                                T_house, rh_house, v_dot_air, house_vol,
+                                desired_temp, cooler_efficiency=cooler_efficiency,
+                                water_weight=water_weight, energy_weight=energy_weight,
+                                site=site, kelvin=True)
+    print(dict(zip(names, scores.tolist())))
+
+    # score and return result, nan scores are skipped
+    if np.all(np.isnan(scores)):
+        return 'Off'
+    best = int(np.nanargmin(scores))
+    if scores[best] < 99999:
+        return names[best]
+    return 'Off'
+
+@profiled
+def score_modes(modes, t, T_ambient, rh_ambient, T_house, rh_house,
+                v_dot_air, v_house, desired_temp, dt = 15, cooler_efficiency = 0.744,
+                water_weight = 0.0, energy_weight = 0.0, rho_air = 0.0340,
+                fan_power = 500.0, pump_power = 40.0, seconds_per_unit = 1.0,
+                site = None, kelvin = False):
+    '''
+    Simulate every mode of the table in one batch and score each by the
+    sum of squared differences between house and desired temperature,
+    plus water_weight per kg of water evaporated and energy_weight per kWh
+    of fan and pump electricity (see simulation.mode_resources, rho_air
+    in kg/ft**3 to match v_dot_air). dt is in the time unit of v_dot_air
+    (seconds_per_unit seconds long), as the simulation moves
+    v_dot_air * dt of air per step. With a site_model.Site the cooler
+    psychrometrics use its pressure and rho_air, given at sea level, is
+    scaled to its air density. Temperatures are celcius, or kelvin with
+    kelvin=True (converted around the cooler correlations); a site
+    rejects kelvin passed as celcius with ValueError.
 
+    Returns
+    -------
+    (names, scores) with scores an array (..., len(modes)).
+    '''
+    names, result = sim.simulate_modes(modes, t, T_ambient, rh_ambient,
+                                       T_house, rh_house, v_dot_air, v_house,
+                                       dt, cooler_efficiency, site, kelvin)
+    scores = ((result.T_house - desired_temp)**2).sum(axis=-1)
+    if water_weight or energy_weight:
+        _, flow, pump = sim.mode_settings(modes, v_dot_air)
+        if site is not None:
+            rho_air = rho_air * site.density_ratio()
+        water, energy = sim.mode_resources(result, flow, pump, dt, rho_air,
+                                           fan_power, pump_power, seconds_per_unit)
+        scores = scores + water_weight * water + energy_weight * energy
+    return names, scores
+
+@profiled
 def forecast_inside_conditions(t, fan, pump, T_ambient, rh_ambient, 
                                T_house, rh_house, v_dot_air, v_house,
-                               dt = 15, cooler_efficiency = 0.744):
+                               dt = 15, cooler_efficiency = 0.744, start = None,
+                               site = None):
     '''
     Forecast condtions inside the house 
 
@@ -89,9 +119,9 @@ def forecast_inside_conditions(t, fan, pump, T_ambient, rh_ambient,
     pump : int
         Pump setting 0=off, 1=on.
     T_ambient : 
-        list of forecast temperatures
+        list of forecast temperatures, or an nws_forecast.Forecast
     rh_ambient : 
-        list of forecast humidities
+        list of forecast humidities (unused with a Forecast)
     T_house: 
         Starting temperature
     rh_house:
@@ -101,44 +131,39 @@ def forecast_inside_conditions(t, fan, pump, T_ambient, rh_ambient,
     v_house:
         volume of house
     dt : Interpolation time steps
+    start : time of the first step when T_ambient is a Forecast
+    site : optional site_model.Site for the cooler psychrometrics
 
     Returns
     -------
     Pandas data frame.
 
     '''
-    # time = datetime.datetime(2021, 1, 16, hour=7, minute=30) 
-    # deltat = datetime.timedelta(minutes=dt)
-    result = []
-    if type(T_ambient) is not list:
-        T_ambient = [T_ambient,] * t
-    n = len(T_ambient)
-    
-    if n < t:
-        T_ambient = T_ambient * ( t // n + 1)
+    return forecast_inside_conditions_fast(t, fan, pump, T_ambient, rh_ambient,
+                                           T_house, rh_house, v_dot_air, v_house,
+                                           dt, cooler_efficiency, start, site).to_frame()
+
+@profiled
+def forecast_inside_conditions_fast(t, fan, pump, T_ambient, rh_ambient,
+                                    T_house, rh_house, v_dot_air, v_house,
+                                    dt = 15, cooler_efficiency = 0.744, start = None,
+                                    site = None):
+    '''
+    Same forecast as forecast_inside_conditions, written into preallocated
+    arrays. Returns a simulation.ForecastResult, call its to_frame() if a
+    pandas data frame is needed.
+    '''
+    T_ambient, rh_ambient = sim.forecast_values(T_ambient, rh_ambient, t, dt, start)
 
-    if type(rh_ambient) is not list:
-        rh_ambient = [rh_ambient,] * t
-    n = len(rh_ambient)
-    
-    if n < t:
-        rh_ambient = rh_ambient * ( t // n + 1)
-    
-    house   = Environment(T_house, rh_house, v_house)
-
-    for i in range(t):
-        T_exhaust, rh_exhaust = cm.calculate_outlet_temp(T_ambient[i], rh_ambient[i], cooler_efficiency * pump)
-        exhaust = Environment(T_exhaust, rh_exhaust, v_dot_air[fan] * dt)
-#        print(exhaust.__dict__)
-        house.remove(exhaust.vol)
-        house.mix(exhaust)
-#        print(house.__dict__)
-        result.append( (i, T_ambient[i], rh_ambient[i], T_exhaust, rh_exhaust, house.tem, house.rh) )
-        # time = time + deltat 
+    T_exhaust, rh_exhaust = sim.exhaust_conditions(T_ambient, rh_ambient, pump,
+                                                   cooler_efficiency, site)
+    T_in, rh_in = sim.simulate(T_exhaust, rh_exhaust, v_dot_air[fan] * dt,
+                               T_house, rh_house, v_house)
 
     ## T(t) = T0 + dT/dt (t)
 
-    return pd.DataFrame(result, columns = ('time', 'T_amb',  'rh_amb', 'T_ext',  'rh_ext', 'T_house', 'rh_house') )
+    return sim.ForecastResult(np.arange(t), T_ambient, rh_ambient,
+                              T_exhaust, rh_exhaust, T_in, rh_in)
 
 if __name__ == '__main__':
     print(get_auto_setting())
@@ -5,17 +5,12 @@ Created on Sat Jan 16 14:05:03 2021
 @author: rjensen
 """
 
-import os, sys
-
-local_module_path=os.path.join(os.path.dirname(os.path.abspath(__file__)),'libs')
-print(local_module_path)
-sys.path.append(local_module_path)
-
 #from cooler_model import *
-import cooler_model as cm
-from Environment import Environment
+from .libs import cooler_model as cm
+from .libs.Environment import Environment
+from .libs import simulation as sim
+from .libs.profiling import profiled
 import numpy as np
-import pandas as pd
 import datetime
 
 ## T is temperature
@@ -24,6 +19,7 @@ import datetime
 # volume of house  250 # m**3
 # inside_temperature cm.c2k( cm.f2c( 90 ) ) # Kelvin
 # inside_rh 40%
+# default starting conditions, read only: forecasts never modify it
 house = Environment(cm.c2k( cm.f2c( 90 ) ) , 40, 250)
 
 # outside conditions
@@ -43,19 +39,25 @@ rho_air = 1.23 # kg/m**3 (sea level)
 # =============================================================================
 # cooler air flow per fan speed
 v_dot_air = (0, 2, 3) # m**3/s 
-m_dot_air = np.array(v_dot_air)*rho_air # kg/s
+m_dot_air = np.array(v_dot_air)*rho_air # kg/s, times site.density_ratio() above sea level
 cooler_efficiency = 0.744
 
 
 
 
 
+@profiled
 def forecast_inside_conditions(t, fan, pump, T_ambient, rh_ambient, 
                                T_house, rh_house,
-                               dt = 30, cooler_efficiency = 0.744):
+                               dt = 30, cooler_efficiency = 0.744,
+                               v_house = house.vol, v_dot_air = v_dot_air,
+                               start = None, site = None):
     '''
     Forecast condtions inside the house 
 
+    The forecast starts from T_house/rh_house and keeps no state between
+    calls, so it is safe to call from several threads at once.
+
     Parameters
     ----------
     t : int
@@ -65,51 +67,48 @@ def forecast_inside_conditions(t, fan, pump, T_ambient, rh_ambient,
     pump : int
         Pump setting 0=off, 1=on.
     T_ambient : 
-        list of forecast temperatures
+        list of forecast temperatures, or an nws_forecast.Forecast that
+        is resampled every dt minutes from start
     rh_ambient : 
-        list of forecast humidities
+        list of forecast humidities (unused with a Forecast)
     T_house: 
         Starting temperature
     rh_house:
         Starting humidity
     dt : Interpolation time steps
+    v_house:
+        volume of house
+    v_dot_air:
+        Air flow from cooler (vector of values)
+    start:
+        time of the first step (datetime), defaults to the first time of a
+        Forecast, as in final_model.forecast_inside_conditions, and to
+        2021-01-16 07:30 for lists
+    site:
+        site_model.Site for the cooler psychrometrics, None for sea level
 
     Returns
     -------
     Pandas data frame.
 
     '''
-    time = datetime.datetime(2021, 1, 16, hour=7, minute=30) 
+    if start is None:
+        start = (datetime.datetime.fromtimestamp(T_ambient.times[0])
+                 if hasattr(T_ambient, 'grid') else
+                 datetime.datetime(2021, 1, 16, hour=7, minute=30))
+    T_ambient, rh_ambient = sim.forecast_values(T_ambient, rh_ambient, t, dt, start)
+
+    T_exhaust, rh_exhaust = sim.exhaust_conditions(T_ambient, rh_ambient, 1,
+                                                   cooler_efficiency, site)
+    T_in, rh_in = sim.simulate(T_exhaust, rh_exhaust, v_dot_air[2] * dt,
+                               T_house, rh_house, v_house)
     deltat = datetime.timedelta(minutes=dt)
-    result = []
-    if type(T_ambient) is not list:
-        T_ambient = [T_ambient,] * t
-    n = len(T_ambient)
-    
-    if n < t:
-        T_ambient = T_ambient * ( t // n + 1)
-
-    if type(rh_ambient) is not list:
-        rh_ambient = [rh_ambient,] * t
-    n = len(rh_ambient)
-    
-    if n < t:
-        rh_ambient = rh_ambient * ( t // n + 1)
-    
-    
-    for i in range(t):
-        T_exhaust, rh_exhaust = cm.calculate_outlet_temp(T_ambient[i], rh_ambient[i], cooler_efficiency)
-        exhaust = Environment(T_exhaust, rh_exhaust, v_dot_air[2] * dt)
-
-        house.remove(exhaust.vol)
-        house.mix(exhaust)
-#        print(house.__dict__)
-        result.append( (time, T_ambient[i], rh_ambient[i], T_exhaust, rh_exhaust, house.tem, house.rh) )
-        time = time + deltat 
+    time = [start + i * deltat for i in range(t)]
 
     ## T(t) = T0 + dT/dt (t)
 
-    return pd.DataFrame(result, columns = ('time', 'T_amb',  'rh_amb', 'T_ext',  'rh_ext', 'T_house', 'rh_house') )
+    return sim.ForecastResult(time, T_ambient, rh_ambient, T_exhaust, rh_exhaust,
+                              T_in, rh_in).to_frame()
 
 def get_auto_setting():
     return_strings=[
@@ -5,6 +5,9 @@ Created on Tue Feb  9 16:36:12 2021
 @author: rjensen
 """
 
+import numpy as np
+from .profiling import profiled
+
 class Environment():
     def __init__(self, temp, rh, volume):
         self.tem = temp
@@ -17,6 +20,7 @@ class Environment():
     def __print__(self):
         return "%r" % (self.__dict__)
         
+    @profiled
     def mix(self, env):
         tvol = self.vol + env.vol
         self.rh  = (self.rh * self.vol + env.rh * env.vol) / tvol
@@ -26,6 +30,82 @@ class Environment():
     def remove(self, vol):
         self.vol -= vol
 
+    def advance(self, env, steps):
+        ''' Same result as repeating remove(env.vol); mix(env) steps times.
+        The volume stays constant, so each step keeps the fraction
+        r = (vol - env.vol) / vol of the current air and the result is
+        env + r**steps * (self - env), computed in O(1). '''
+        if steps <= 0:
+            return
+        r = (self.vol - env.vol) / self.vol
+        decay = r ** steps
+        self.rh  = env.rh  + decay * (self.rh  - env.rh)
+        self.tem = env.tem + decay * (self.tem - env.tem)
+
+    def advance_segments(self, segments):
+        ''' segments - iterable of (env, steps) pairs, for forecasts that
+        hold the exhaust constant over stretches of steps '''
+        for env, steps in segments:
+            self.advance(env, steps)
+
+
+class EnvironmentEnsemble():
+    '''
+    N environments held as contiguous arrays of temperature, rh and volume.
+    mix and remove work on every member in one step, an optional boolean
+    mask (where) leaves the unselected members untouched.
+    '''
+    def __init__(self, temp, rh, volume):
+        temp, rh, volume = np.broadcast_arrays(temp, rh, volume)
+        self.tem = np.array(temp, dtype=float)
+        self.rh  = np.array(rh, dtype=float)
+        self.vol = np.array(volume, dtype=float)
+
+    @classmethod
+    def from_environments(cls, envs):
+        return cls([e.tem for e in envs], [e.rh for e in envs],
+                   [e.vol for e in envs])
+
+    def __len__(self):
+        return len(self.tem)
+
+    def __getitem__(self, i):
+        return Environment(float(self.tem[i]), float(self.rh[i]),
+                           float(self.vol[i]))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__, self.__dict__)
+
+    def mix(self, env, where=None):
+        ''' env is an Environment or an EnvironmentEnsemble of the same
+        length, members that get no volume (or are masked out) are unchanged '''
+        vol = np.broadcast_to(env.vol, self.vol.shape)
+        if where is not None:
+            vol = np.where(where, vol, 0.0)
+        tvol = self.vol + vol
+        self.rh  = (self.rh * self.vol + env.rh * vol) / tvol
+        self.tem = (self.tem* self.vol + env.tem* vol) / tvol
+        self.vol = tvol
+
+    def remove(self, vol, where=None):
+        if where is not None:
+            vol = np.where(where, vol, 0.0)
+        self.vol -= vol
+
+    def advance(self, env, steps, where=None):
+        ''' Array version of Environment.advance, steps may differ per member '''
+        steps = np.asarray(steps)
+        if where is not None:
+            steps = np.where(where, steps, 0)
+        r = (self.vol - env.vol) / self.vol
+        decay = np.where(steps > 0, r ** np.maximum(steps, 0), 1.0)
+        self.rh  = env.rh  + decay * (self.rh  - env.rh)
+        self.tem = env.tem + decay * (self.tem - env.tem)
+
+    def advance_segments(self, segments):
+        for env, steps in segments:
+            self.advance(env, steps)
+
 
 if __name__ == '__main__':
     house   = Environment(80, 25,10000)
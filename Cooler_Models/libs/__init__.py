@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Building blocks of the cooler and house models: psychrometrics, the
+Environment air volumes, the batched simulation and the controller tools
+around them. The modules import each other relatively, use them through
+the package, e.g. from Cooler_Models.libs import cooler_model as cm.
+"""
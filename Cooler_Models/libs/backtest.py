@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Backtesting of controller policies against historical weather.
+
+A year (or more) of weather records is replayed through the
+forecast_inside_conditions dynamics for many houses at once: houses are
+the leading array axis and the cooler output for every mode, house and
+record is computed up front in one batched call. A record spans many
+simulation steps of dt with the same exhaust, so it is applied in closed
+form (Environment.advance) and the replay loop only does a few array
+operations per record whatever the number of houses. Policies that do
+not look at the house (FixedSchedulePolicy) skip the loop altogether.
+
+A policy is any callable policy(k, T_house, rh_house, backtest) returning
+the mode index (into the backtest's mode table) for every house at
+record k. AutoSettingPolicy, FixedSchedulePolicy and ThresholdPolicy
+cover get_auto_setting, time of day schedules and thermostat style
+hysteresis.
+"""
+
+import numpy as np
+from . import simulation as sim
+
+
+class BacktestResult():
+    def __init__(self, modes, T_house, rh_house, comfort_rmse, discomfort_hours,
+                 fan_hours, pump_hours, water):
+        # mode index per house and record, house conditions after each record
+        self.modes            = modes
+        self.T_house          = T_house
+        self.rh_house         = rh_house
+        # per house summaries
+        self.comfort_rmse     = comfort_rmse
+        self.discomfort_hours = discomfort_hours
+        self.fan_hours        = fan_hours
+        self.pump_hours       = pump_hours
+        self.water            = water
+
+    def summary(self):
+        return {'comfort_rmse': self.comfort_rmse, 'discomfort_hours': self.discomfort_hours,
+                'fan_hours': self.fan_hours, 'pump_hours': self.pump_hours,
+                'water': self.water}
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__, self.summary())
+
+
+class Backtest():
+    def __init__(self, T_ambient, rh_ambient, modes, v_dot_air, v_house, desired_temp,
+                 dt = 15, cooler_efficiency = 0.744, hours_per_record = 1.0,
+                 seconds_per_unit = 1.0):
+        '''
+        Parameters
+        ----------
+        T_ambient, rh_ambient :
+            weather records (n,) shared by all houses or (houses, n)
+        modes :
+            mode table, see simulation.mode_settings
+        v_dot_air, dt :
+            air flow per fan setting and simulation step, as for
+            forecast_inside_conditions, in the same time unit
+        v_house, desired_temp, cooler_efficiency :
+            scalars or one value per house
+        hours_per_record :
+            spacing of the records, each record is hours_per_record * 3600
+            / (dt * seconds_per_unit) simulation steps
+        seconds_per_unit :
+            length of the time unit of v_dot_air and dt in seconds
+        '''
+        self.names, self.flow, self.pump = sim.mode_settings(modes, v_dot_air)
+        T_ambient = np.atleast_2d(np.asarray(T_ambient, dtype=float))
+        rh_ambient = np.atleast_2d(np.asarray(rh_ambient, dtype=float))
+        v_house, desired_temp, cooler_efficiency = (np.atleast_1d(np.asarray(x, dtype=float))
+                                                    for x in (v_house, desired_temp, cooler_efficiency))
+        houses = max(len(T_ambient), len(rh_ambient), len(v_house),
+                     len(desired_temp), len(cooler_efficiency))
+        n = T_ambient.shape[-1]
+        self.T_ambient  = np.broadcast_to(T_ambient, (houses, n))
+        self.rh_ambient = np.broadcast_to(rh_ambient, (houses, n))
+        self.v_house = np.broadcast_to(v_house, (houses,))
+        self.desired_temp = np.broadcast_to(desired_temp, (houses,))
+        self.hours_per_record = hours_per_record
+        self.vol = self.flow * dt
+        if np.any(self.vol[None, :] >= self.v_house[:, None]):
+            raise ValueError('dt too long: a step would exchange the whole house')
+        # fraction of the house air left after a record in each mode,
+        # remove/mix repeated steps_per_record times (houses, modes)
+        self.steps_per_record = hours_per_record * 3600 / (dt * seconds_per_unit)
+        self.decay = ((self.v_house[:, None] - self.vol) / self.v_house[:, None]) \
+            ** self.steps_per_record
+
+        # cooler output for every house, mode and record, (houses, modes, n)
+        self.T_exhaust, self.rh_exhaust = sim.exhaust_conditions(
+            self.T_ambient[:, None, :], self.rh_ambient[:, None, :],
+            self.pump[None, :, None], cooler_efficiency[:, None, None]
+            if len(cooler_efficiency) > 1 else cooler_efficiency[0])
+
+    @property
+    def houses(self):
+        return self.T_ambient.shape[0]
+
+    @property
+    def records(self):
+        return self.T_ambient.shape[1]
+
+    def run(self, policy, T_house, rh_house, comfort_band = 1.0, water_rate = 3.5):
+        '''
+        Replay the weather with the policy.
+
+        Parameters
+        ----------
+        policy :
+            callable(k, T_house, rh_house, backtest) -> mode index per house
+        T_house, rh_house :
+            starting conditions, scalars or per house
+        comfort_band :
+            temperature difference to desired_temp tolerated before an hour
+            counts as uncomfortable
+        water_rate :
+            estimated water use per pump hour
+
+        Returns
+        -------
+        BacktestResult
+        '''
+        houses, n = self.houses, self.records
+        T  = np.broadcast_to(np.asarray(T_house, dtype=float), (houses,)).copy()
+        rh = np.broadcast_to(np.asarray(rh_house, dtype=float), (houses,)).copy()
+        rows = np.arange(houses)
+        if hasattr(policy, 'modes'):
+            # the modes do not depend on the house, no replay loop needed
+            modes = np.broadcast_to(policy.modes(self), (houses, n))
+            decay = self.decay[rows[:, None], modes]
+            records = np.arange(n)
+            T_exh = self.T_exhaust[rows[:, None], modes, records]
+            rh_exh = self.rh_exhaust[rows[:, None], modes, records]
+            T_out = affine_scan(decay, (1 - decay) * T_exh, T)
+            rh_out = affine_scan(decay, (1 - decay) * rh_exh, rh)
+        else:
+            modes = np.empty((houses, n), dtype=int)
+            T_out = np.empty((houses, n))
+            rh_out = np.empty((houses, n))
+            for k in range(n):
+                m = policy(k, T, rh, self)
+                d = self.decay[rows, m]
+                T_exh = self.T_exhaust[rows, m, k]
+                rh_exh = self.rh_exhaust[rows, m, k]
+                T  = T_exh  + d * (T  - T_exh)
+                rh = rh_exh + d * (rh - rh_exh)
+                modes[:, k] = m
+                T_out[:, k] = T
+                rh_out[:, k] = rh
+
+        error = T_out - self.desired_temp[:, None]
+        hours = self.hours_per_record
+        pump_hours = (self.pump[modes] > 0).sum(axis=1) * hours
+        return BacktestResult(modes, T_out, rh_out,
+                              np.sqrt(np.mean(error**2, axis=1)),
+                              (abs(error) > comfort_band).sum(axis=1) * hours,
+                              (self.flow[modes] > 0).sum(axis=1) * hours,
+                              pump_hours, pump_hours * water_rate)
+
+
+def affine_scan(a, b, x0):
+    '''
+    x[k] = a[k] * x[k-1] + b[k] along the last axis starting from x0, as
+    a prefix scan of the affine maps (log2(n) array passes, no division
+    so fast decays just underflow to 0)
+    '''
+    A, B = a.astype(float), b.astype(float)
+    shift = 1
+    while shift < A.shape[-1]:
+        B[..., shift:] = A[..., shift:] * B[..., :-shift] + B[..., shift:]
+        A[..., shift:] = A[..., shift:] * A[..., :-shift]
+        shift *= 2
+    return A * np.asarray(x0, dtype=float)[..., None] + B
+
+
+class AutoSettingPolicy():
+    '''
+    get_auto_setting: best constant mode over the next horizon records.
+    The house is linear in its starting temperature T0, so the score of a
+    mode, sum over the horizon of (e_i T0 + c_i - desired)**2, is a
+    quadratic in T0 whose coefficients are computed for every record up
+    front. Each record then costs a few array operations.
+    '''
+    def __init__(self, horizon = 4, candidates = None):
+        self.horizon = horizon
+        # indexes of the modes to consider, None for all
+        self.candidates = candidates
+        self._bt = None
+
+    def _prepare(self, bt):
+        decay = bt.decay[:, :, None]                   # (houses, modes, 1)
+        desired = bt.desired_temp[:, None, None]
+        n = bt.records
+        e = np.ones_like(decay)
+        c = np.zeros(bt.T_exhaust.shape)
+        S2 = np.zeros(c.shape)
+        S1 = np.zeros(c.shape)
+        S0 = np.zeros(c.shape)
+        for i in range(self.horizon):
+            # house after i+1 records of a constant mode from record k
+            T_exh = np.zeros(c.shape)
+            T_exh[..., :n-i] = bt.T_exhaust[..., i:]
+            e = e * decay
+            c = decay * c + (1 - decay) * T_exh
+            valid = (np.arange(n) < n - i)
+            S2 += valid * e**2
+            S1 += valid * e * (c - desired)
+            S0 += valid * (c - desired)**2
+        if self.candidates is not None:
+            mask = np.full(bt.T_exhaust.shape[1], np.inf)
+            mask[self.candidates] = 0
+            S0 += mask[None, :, None]
+        # record major so each record reads one contiguous block
+        self._S = [np.ascontiguousarray(np.moveaxis(S, -1, 0)) for S in (S2, S1, S0)]
+        self._bt = bt
+
+    def __call__(self, k, T_house, rh_house, bt):
+        if self._bt is not bt:
+            self._prepare(bt)
+        S2, S1, S0 = (S[k] for S in self._S)
+        T0 = T_house[:, None]
+        return np.argmin(T0 * (T0 * S2 + 2 * S1) + S0, axis=1)
+
+
+class FixedSchedulePolicy():
+    ''' mode index by record of the day, e.g. 24 entries for hourly records '''
+    def __init__(self, schedule):
+        self.schedule = np.asarray(schedule, dtype=int)
+
+    def __call__(self, k, T_house, rh_house, bt):
+        return np.full(bt.houses, self.schedule[k % len(self.schedule)])
+
+    def modes(self, bt):
+        ''' the whole replay at once, the schedule ignores the house '''
+        return np.resize(self.schedule, bt.records)
+
+
+class ThresholdPolicy():
+    ''' thermostat: switch to on_mode above desired + on_above and back to
+    off_mode below desired - off_below '''
+    def __init__(self, on_mode, off_mode = 0, on_above = 1.0, off_below = 1.0):
+        self.on_mode = on_mode
+        self.off_mode = off_mode
+        self.on_above = on_above
+        self.off_below = off_below
+        self.state = None
+
+    def __call__(self, k, T_house, rh_house, bt):
+        if k == 0 or self.state is None:
+            self.state = np.zeros(bt.houses, dtype=bool)
+        error = T_house - bt.desired_temp
+        self.state = (error > self.on_above) | (self.state & (error > -self.off_below))
+        return np.where(self.state, self.on_mode, self.off_mode)
+
+
+if __name__ == '__main__':
+    import time
+    from . import cooler_model as cm
+    hour = np.arange(8760)
+    season = 10 * np.sin(2 * np.pi * (hour / 8760 - 0.3))
+    T_ambient = 24 + season + 8 * np.sin(2 * np.pi * (hour - 9) / 24)    # celcius
+    rh_ambient = 25 - 8 * np.sin(2 * np.pi * (hour - 9) / 24)
+    modes = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+    names = list(modes)
+    bt = Backtest(T_ambient, rh_ambient, modes, (0, 70, 106),
+                  np.linspace(8000, 14000, 100), cm.f2c(75))
+    policies = {'auto':      AutoSettingPolicy(),
+                'threshold': ThresholdPolicy(names.index('Fan Hi (w/Pump)')),
+                'schedule':  FixedSchedulePolicy([0] * 10 + [names.index('Fan Lo (w/Pump)')] * 10 + [0] * 4)}
+    for name, policy in policies.items():
+        start = time.perf_counter()
+        result = bt.run(policy, cm.f2c(80), 30)
+        print('{:10s} {:.2f} s for {} houses, rmse {:.2f} fan {:.0f} h pump {:.0f} h'.format(
+            name, time.perf_counter() - start, bt.houses, result.comfort_rmse.mean(),
+            result.fan_hours.mean(), result.pump_hours.mean()))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration of cooler efficiency, house volume and infiltration from
+logged data.
+
+Each logged step is modelled like forecast_inside_conditions: the house
+loses the cooler exhaust volume plus an infiltration volume, then mixes
+in the exhaust and the same volume of ambient air
+
+    T' = (T * (V - ve - vl) + Te * ve + Ta * vl) / V,   vl = q * dt
+
+The efficiency follows directly from the exhaust and wet bulb
+temperatures. V and q start from a one step linear least squares fit and
+are refined on the free running simulation error, with all candidate
+(V, q) pairs simulated together as one batch.
+"""
+
+import numpy as np
+from . import cooler_model as cm
+
+
+class CalibrationResult():
+    def __init__(self, efficiency, volume, infiltration, rmse):
+        self.efficiency   = efficiency
+        self.volume       = volume
+        self.infiltration = infiltration
+        # rms error of the simulated indoor temperature
+        self.rmse         = rmse
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__, self.__dict__)
+
+
+def fit_efficiency(t_amb, rh_amb, t_exh, pump=None):
+    '''
+    Least squares cooler efficiency from eq 2,
+    temperatures celcius, rh %, pump optional 0/1 array selecting the
+    samples taken with the pump running. Raises ValueError when there
+    are no (pump on) samples to fit.
+    '''
+    t_amb, rh_amb, t_exh = (np.asarray(x, dtype=float) for x in (t_amb, rh_amb, t_exh))
+    if pump is not None:
+        on = np.asarray(pump) > 0
+        t_amb, rh_amb, t_exh = t_amb[on], rh_amb[on], t_exh[on]
+    if t_amb.size == 0:
+        raise ValueError('no pump-on samples to fit the efficiency')
+    depression = t_amb - cm.calculate_t_wet_batch(t_amb, rh_amb)
+    return float(np.sum((t_amb - t_exh) * depression) / np.sum(depression**2))
+
+
+def simulate_house(t_amb, t_exh, flow, t_start, volume, infiltration, dt = 1):
+    '''
+    Indoor temperature for every candidate (volume, infiltration) pair.
+
+    Parameters
+    ----------
+    t_amb, t_exh, flow :
+        logged arrays (n,) of ambient and exhaust temperature and cooler
+        air flow
+    t_start :
+        indoor temperature at the first sample
+    volume, infiltration :
+        candidate arrays (c,) of house volume and infiltration flow
+
+    Returns
+    -------
+    array (c, n) of simulated indoor temperatures, starting with t_start
+    '''
+    volume = np.asarray(volume, dtype=float)
+    infiltration = np.asarray(infiltration, dtype=float)
+    v_exh  = np.asarray(flow, dtype=float) * dt
+    v_leak = infiltration * dt
+    n = len(t_exh)
+    out = np.empty(volume.shape + (n,))
+    T = np.full(volume.shape, float(t_start))
+    out[..., 0] = T
+    for k in range(n - 1):
+        # house.remove(exhaust.vol + leak.vol); house.mix(exhaust); house.mix(leak)
+        T = (T * (volume - v_exh[k] - v_leak) + t_exh[k] * v_exh[k]
+             + t_amb[k] * v_leak) / volume
+        out[..., k + 1] = T
+    return out
+
+
+def fit_house(t_amb, t_exh, t_in, flow, dt = 1, rounds = 4, grid = 9):
+    '''
+    Estimate house volume and infiltration from logged indoor temperature.
+
+    Returns
+    -------
+    (volume, infiltration, rmse)
+    '''
+    t_amb, t_exh, t_in, flow = (np.asarray(x, dtype=float) for x in (t_amb, t_exh, t_in, flow))
+    # one step fit, dT = a * ve * (Te - T) + b * dt * (Ta - T), a = 1/V, b = q/V
+    X = np.stack((flow[:-1] * dt * (t_exh[:-1] - t_in[:-1]),
+                  dt * (t_amb[:-1] - t_in[:-1])), axis=1)
+    (a, b), *_ = np.linalg.lstsq(X, np.diff(t_in), rcond=None)
+    volume = 1 / a if a > 0 else np.max(flow) * dt * 10
+    infiltration = max(b * volume, 0.0)
+
+    # refine on the simulation error, shrinking the search box each round
+    v_span, q_span = 0.5 * volume, 0.5 * infiltration + 1e-3 * volume / dt
+    for i in range(rounds):
+        v = np.linspace(max(volume - v_span, 1e-9), volume + v_span, grid)
+        q = np.linspace(max(infiltration - q_span, 0.0), infiltration + q_span, grid)
+        V, Q = np.meshgrid(v, q, indexing='ij')
+        sim = simulate_house(t_amb, t_exh, flow, t_in[0], V.ravel(), Q.ravel(), dt)
+        rmse = np.sqrt(np.mean((sim - t_in)**2, axis=-1))
+        best = int(np.nanargmin(rmse))
+        volume, infiltration = V.ravel()[best], Q.ravel()[best]
+        v_span, q_span = 2 * v_span / (grid - 1), 2 * q_span / (grid - 1)
+    return float(volume), float(infiltration), float(rmse[best])
+
+
+def calibrate(t_amb, rh_amb, t_exh, t_in, flow, pump=None, dt = 1, rounds = 4):
+    '''
+    Fit efficiency, volume and infiltration from logged time series.
+    Temperatures celcius, rh %, flow in house volume units per dt unit.
+    '''
+    efficiency = fit_efficiency(t_amb, rh_amb, t_exh, pump)
+    volume, infiltration, rmse = fit_house(t_amb, t_exh, t_in, flow, dt, rounds)
+    return CalibrationResult(efficiency, volume, infiltration, rmse)
+
+
+if __name__ == '__main__':
+    import time
+    rng = np.random.default_rng(0)
+    n = 30 * 24 * 60
+    hour = np.arange(n) / 60
+    t_amb = 30 + 8 * np.sin(2 * np.pi * (hour - 9) / 24)
+    rh_amb = 25 - 8 * np.sin(2 * np.pi * (hour - 9) / 24)
+    pump = (np.sin(2 * np.pi * hour / 24) < 0.3).astype(float)
+    flow = pump * 0.5 * 60                   # m**3 per minute
+    t_exh = np.where(pump > 0, cm.calculate_outlet_temp_batch(t_amb, rh_amb, 0.744)[0], t_amb)
+    t_in = simulate_house(t_amb, t_exh, flow, 28, 250, 0.5, dt=1)
+    t_in = t_in + rng.normal(0, 0.05, n)
+    start = time.perf_counter()
+    print(calibrate(t_amb, rh_amb, t_exh, t_in, flow, pump))
+    print('{:.2f} s'.format(time.perf_counter() - start))
@@ -13,6 +13,7 @@ Waleed A Abdel-FadeelWaleed A Abdel-FadeelSoubhi A. Hassanein
 """
 
 import numpy as np
+from .profiling import profiled
 
 def c2k(c):
     ''' Celcius to Kelvin '''
@@ -30,6 +31,7 @@ def c2f(c):
     ''' Celsius to Fahrenheit '''
     return (c)*9/5 + 32
 
+@profiled
 def U(ta, tw, p=1013.25):
     ''' 
     Parameters
@@ -96,6 +98,7 @@ def calculate_t_wet(t_amb, rh):
     
     return( (a1*t_amb**n1 + b1) * rh**2 + (a2*t_amb**n2 + b2) * rh +(a3*t_amb**n3 + b3) )
  
+@profiled
 def calculate_outlet_temp(t_amb, rh, efficiency = 0.75):
     ''' t_amb - ambient temperature celcius, rh - relative humidity %
     efficiency = (t_amb - t_exh) / (t_amb - t_wet)
@@ -107,6 +110,129 @@ def calculate_outlet_temp(t_amb, rh, efficiency = 0.75):
     rh_exh = U(c2k(t_exh), c2k(t_wet)) * 100
     return(t_exh, rh_exh)
 
+def _saturation_term(T):
+    ''' 10**(c + b/T) * T**a from NASA TN D-8401 eq 24, T in kelvin,
+    evaluated with a single exp so whole arrays cost one pass
+    '''
+    a =-4.9283
+    b= -2937.4
+    c= 23.5518
+    return np.exp(np.log(10) * (c + b/T) + a * np.log(T))
+
+@profiled
+def U_batch(ta, tw, p=1013.25):
+    '''
+    Array version of U, inputs are broadcast against each other.
+
+    Parameters
+    ----------
+    ta : ambient temperature kelvin
+    tw : wet bulb temperature kelvin
+    p : pressure millibars
+
+    Returns
+    ----------
+    relative humidity in decimal (ndarray)
+
+    '''
+    f=6.6e-4
+    g=7.570e-7
+    ta = np.asarray(ta, dtype=float)
+    tw = np.asarray(tw, dtype=float)
+    ## NASA TN D-8401 eq 24, rearranged as (e_w - (f+g*tw)*p*(ta-tw)) / e_a
+    return (_saturation_term(tw) - (f+g*tw) * p * (ta-tw)) / _saturation_term(ta)
+
+def calculate_t_wet_batch(t_amb, rh):
+    ''' Array version of calculate_t_wet.
+    t_amb - ambient temperature celcius, rh - relative humidity %
+    returns wet temperature in celcius (ndarray)
+    '''
+    ### abdel-faheed eq 9
+    a1=-2.21e-6
+    n1=1.724
+    b1=7.87e-5
+    a2=9.58e-4
+    n2=1.549
+    b2=6.91e-2
+    a3=1.5924
+    n3=0.727
+    b3=-7.843
+
+    t_amb = np.asarray(t_amb, dtype=float)
+    rh = np.asarray(rh, dtype=float)
+    # share one log between the three fractional powers
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_t = np.log(t_amb)
+    return( (a1*np.exp(n1*log_t) + b1) * rh**2 + (a2*np.exp(n2*log_t) + b2) * rh
+           +(a3*np.exp(n3*log_t) + b3) )
+
+@profiled
+def calculate_outlet_temp_batch(t_amb, rh, efficiency = 0.75, p=1013.25):
+    ''' Array version of calculate_outlet_temp.
+    t_amb - ambient temperature celcius, rh - relative humidity %,
+    efficiency - cooler efficiency in decimal, p - pressure millibars.
+    All arguments are broadcast against each other.
+    return (t_exh, rh_exh) arrays of cooler output temperature celcius and %
+    '''
+    t_amb, rh, efficiency = np.broadcast_arrays(
+        np.asarray(t_amb, dtype=float), np.asarray(rh, dtype=float),
+        np.asarray(efficiency, dtype=float))
+    t_wet = calculate_t_wet_batch(t_amb, rh)
+    t_exh = t_amb - efficiency * (t_amb - t_wet)
+    rh_exh = U_batch(c2k(t_exh), c2k(t_wet), p) * 100
+    return(t_exh, rh_exh)
+
+def calculate_t_wet_from_rh(ta, rh, p=1013.25, iterations=4, tol=1e-6):
+    '''
+    Inverse of U: the wet bulb temperature that reproduces a measured
+    relative humidity. Newton's method on arrays, always runs the same
+    number of iterations so a batch costs the same whatever its content.
+
+    Parameters
+    ----------
+    ta : ambient (dry bulb) temperature kelvin
+    rh : measured relative humidity %
+    p : pressure millibars
+    iterations : number of Newton steps
+    tol : allowed error of U in decimal relative humidity
+
+    Returns
+    ----------
+    (tw, converged) wet bulb temperature kelvin and a boolean array that
+    is False where U(ta, tw, p) is still further than tol from rh
+
+    '''
+    a =-4.9283
+    b= -2937.4
+    f=6.6e-4
+    g=7.570e-7
+    ta, target = np.broadcast_arrays(np.asarray(ta, dtype=float),
+                                     np.asarray(rh, dtype=float) / 100)
+    e_a = _saturation_term(ta)
+    # the abdel-faheed correlation is a close starting point
+    tw = np.clip(c2k(calculate_t_wet_batch(k2c(ta), target * 100)), ta - 60, ta)
+    tw = np.where(np.isfinite(tw), tw, ta - 5)
+    for i in range(iterations):
+        e_w = _saturation_term(tw)
+        err = (e_w - (f+g*tw) * p * (ta-tw)) / e_a - target
+        ## d/dtw of NASA TN D-8401 eq 24
+        slope = (e_w * (-np.log(10) * b / tw**2 + a / tw)
+                 - p * (g * (ta-tw) - (f+g*tw))) / e_a
+        tw = np.clip(tw - err / slope, ta - 60, ta)
+    converged = abs(U_batch(ta, tw, p) - target) <= tol
+    return(tw, converged)
+
+def calculate_evaporation_rate(t_amb, t_exh, m_dot_air):
+    ''' t_amb, t_exh - air temperature into and out of the cooler celcius,
+    m_dot_air - air mass flow kg/s
+    returns kg/s of water evaporated. The cooler is taken as adiabatic:
+    the sensible enthalpy the air loses vaporises the water.
+    Works on arrays.
+    '''
+    sensible = calculate_enthalpy(c2k(t_amb), 0) - calculate_enthalpy(c2k(t_exh), 0)
+    latent = calculate_enthalpy(c2k(t_exh), 100) - calculate_enthalpy(c2k(t_exh), 0)
+    return m_dot_air * sensible / latent
+
 def calculate_cooler_efficiency(t_amb, t_exh, t_wet):
     '''
     temperatures in the same units,
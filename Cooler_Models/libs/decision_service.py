@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Local decision service for many virtual thermostats on one model host.
+
+Requests (house state plus a forecast, inline or by the name of a
+registered forecast) are queued for a short window and then scored
+together: every house of the batch and every mode go through one
+simulation.simulate_modes call of shape (houses, modes, t), the same
+scoring get_auto_setting uses. Each caller gets its own answer.
+
+    python -m Cooler_Models.libs.decision_service --port 8765 --window 0.005
+    python -m Cooler_Models.libs.decision_service --unix /tmp/cooler.sock
+
+    POST /forecast  {"name": "site-1", "T_ambient": [...], "rh_ambient": [...]}
+    POST /decide    {"T_house": 305, "rh_house": 30, "forecast": "site-1"}
+                    or a list of those, answered with a list in which
+                    malformed entries get {"error": ...}
+    GET  /metrics   batch sizes, queue wait and latency percentiles
+
+A request may also carry T_ambient / rh_ambient itself, as lists of
+exactly t values, and override v_house and desired_temp. Answers are
+{"mode": name, "scores": {...}}, malformed requests get an error of
+their own and do not affect the rest of their batch.
+"""
+
+import collections
+import json
+import socketserver
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from . import cooler_model as cm
+from . import simulation as sim
+from .profiling import _percentile
+
+
+class DecisionBatcher():
+    '''
+    Collects decision requests for up to window seconds (or max_batch
+    requests) and evaluates them in one batch on a worker thread.
+    Settings not given per request default to those of get_auto_setting,
+    temperatures are kelvin like there.
+    '''
+    def __init__(self, modes = None, t = 4, v_dot_air = (0, 70, 106), v_house = 10000,
+                 desired_temp = cm.c2k(cm.f2c(75)), dt = 15, cooler_efficiency = 0.744,
+                 window = 0.005, max_batch = 4096, history = 10000):
+        if modes is None:
+            modes = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+        self.modes = modes
+        self.t = t
+        self.v_dot_air = v_dot_air
+        self.v_house = v_house
+        self.desired_temp = desired_temp
+        self.dt = dt
+        self.cooler_efficiency = cooler_efficiency
+        self.window = window
+        self.max_batch = max_batch
+        self.forecasts = {}
+        self._queue = collections.deque()
+        self._ready = threading.Condition()
+        self._running = True
+        # metrics, the last history batches and requests
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self._batch_sizes = collections.deque(maxlen=history)
+        self._batch_seconds = collections.deque(maxlen=history)
+        self._waits = collections.deque(maxlen=history)
+        self._latencies = collections.deque(maxlen=history)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def __repr__(self):
+        return "%s(%d forecasts, window %g s)" % (self.__class__.__name__,
+                                                  len(self.forecasts), self.window)
+
+    def add_forecast(self, name, T_ambient, rh_ambient):
+        ''' register a forecast that requests refer to by name, hourly
+        lists shorter than t are cycled as in forecast_inside_conditions '''
+        for values in (T_ambient, rh_ambient):
+            if np.ndim(values) != 1:
+                raise ValueError('forecast must be a list of values')
+        self.forecasts[name] = (sim.expand_forecast(T_ambient, self.t),
+                                sim.expand_forecast(rh_ambient, self.t))
+
+    def submit(self, request):
+        ''' queue one request dict, returns a Future of the answer dict.
+        Raises RuntimeError once the batcher is closed. '''
+        future = Future()
+        with self._ready:
+            if not self._running:
+                raise RuntimeError('decision batcher is closed')
+            self._queue.append((time.perf_counter(), request, future))
+            self._ready.notify()
+        return future
+
+    def decide(self, request, timeout = None):
+        return self.submit(request).result(timeout)
+
+    def close(self):
+        ''' answer what is queued, then fail anything the worker left '''
+        with self._ready:
+            self._running = False
+            self._ready.notify()
+        self._worker.join()
+        with self._ready:
+            while self._queue:
+                future = self._queue.popleft()[2]
+                if not future.done():
+                    future.set_exception(RuntimeError('decision batcher is closed'))
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while self._running and not self._queue:
+                    self._ready.wait()
+                if not self._queue:
+                    return
+                # the window starts with the oldest waiting request
+                deadline = self._queue[0][0] + self.window
+                while self._running and len(self._queue) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._ready.wait(remaining)
+                batch = [self._queue.popleft()
+                         for i in range(min(len(self._queue), self.max_batch))]
+            try:
+                self._evaluate(batch)
+            except Exception as e:
+                # never leave a caller waiting, and keep serving
+                for item in batch:
+                    if not item[2].done():
+                        item[2].set_exception(e)
+
+    def _inputs(self, request):
+        if 'forecast' in request:
+            T_ambient, rh_ambient = self.forecasts[request['forecast']]
+        else:
+            T_ambient = np.asarray(request['T_ambient'], dtype=float)
+            rh_ambient = np.asarray(request['rh_ambient'], dtype=float)
+            if T_ambient.shape != (self.t,) or rh_ambient.shape != (self.t,):
+                raise ValueError('T_ambient and rh_ambient must hold {} values'.format(self.t))
+        return (T_ambient, rh_ambient, float(request['T_house']), float(request['rh_house']),
+                float(request.get('v_house', self.v_house)),
+                float(request.get('desired_temp', self.desired_temp)))
+
+    def _evaluate(self, batch):
+        start = time.perf_counter()
+        valid, inputs = [], []
+        for item in batch:
+            try:
+                inputs.append(self._inputs(item[1]))
+                valid.append(item)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                item[2].set_exception(ValueError('bad request: {!r}'.format(e)))
+        answered = 0
+        try:
+            if inputs:
+                T_ambient, rh_ambient, T_house, rh_house, v_house, desired = \
+                    [np.array(x) for x in zip(*inputs)]
+                names, result = sim.simulate_modes(self.modes, self.t, T_ambient, rh_ambient,
+                                                   T_house, rh_house, self.v_dot_air,
+                                                   v_house, self.dt, self.cooler_efficiency,
+                                                   kelvin=True)
+                scores = ((result.T_house - desired[:, None, None])**2).sum(axis=-1)
+                best = np.argmin(scores, axis=-1)
+                answers = []
+                for i in range(len(valid)):
+                    # same fallback as get_auto_setting
+                    mode = names[best[i]] if scores[i, best[i]] < 99999 else 'Off'
+                    answers.append({'mode': mode,
+                                    'scores': dict(zip(names, scores[i].tolist()))})
+                for item, answer in zip(valid, answers):
+                    item[2].set_result(answer)
+                answered = len(valid)
+        except Exception as e:
+            for item in valid:
+                if not item[2].done():
+                    item[2].set_exception(e)
+        end = time.perf_counter()
+        with self._lock:
+            self.requests += len(batch)
+            self.errors += len(batch) - answered
+            self.batches += 1
+            self._batch_sizes.append(len(batch))
+            self._batch_seconds.append(end - start)
+            self._waits.extend(start - item[0] for item in batch)
+            self._latencies.extend(end - item[0] for item in batch)
+
+    def metrics(self):
+        ''' counters and percentiles in seconds, json ready '''
+        def summary(values):
+            values = sorted(values)
+            return {'mean': sum(values) / len(values) if values else 0.0,
+                    'p50': _percentile(values, 50),
+                    'p90': _percentile(values, 90),
+                    'p99': _percentile(values, 99),
+                    'max': values[-1] if values else 0.0}
+        with self._lock:
+            return {'requests': self.requests, 'batches': self.batches,
+                    'errors': self.errors, 'queued': len(self._queue),
+                    'batch_size': summary(self._batch_sizes),
+                    'batch_seconds': summary(self._batch_seconds),
+                    'queue_wait': summary(self._waits),
+                    'latency': summary(self._latencies)}
+
+
+class DecisionHandler(BaseHTTPRequestHandler):
+    ''' json over HTTP, the server carries the batcher '''
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(200, self.server.batcher.metrics())
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        batcher = self.server.batcher
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if self.path == '/forecast':
+                batcher.add_forecast(body['name'], body['T_ambient'], body['rh_ambient'])
+                self._reply(200, {'forecast': body['name']})
+            elif self.path == '/decide':
+                if isinstance(body, list):
+                    # a bad entry gets its own error, the others their answers
+                    futures = [batcher.submit(r) for r in body]
+                    deadline = time.perf_counter() + self.server.result_timeout
+                    answers = []
+                    for f in futures:
+                        try:
+                            answers.append(f.result(max(deadline - time.perf_counter(), 0)))
+                        except ValueError as e:
+                            answers.append({'error': str(e)})
+                    self._reply(200, answers)
+                else:
+                    answer = batcher.submit(body).result(self.server.result_timeout)
+                    self._reply(200, answer)
+            else:
+                self._reply(404, {'error': 'not found'})
+        except TimeoutError:
+            self._reply(504, {'error': 'no decision within {} s'.format(self.server.result_timeout)})
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+
+    def address_string(self):
+        # unix sockets have no client host
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DecisionHTTPServer(ThreadingHTTPServer):
+    # many thermostats connect at once, the default backlog is 5
+    request_queue_size = 1024
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def make_server(batcher, host = '127.0.0.1', port = 8765, unix = None,
+                result_timeout = 10.0):
+    ''' HTTP server on host:port, or on the unix socket path unix.
+    A decision not ready within result_timeout seconds is answered 504. '''
+    if unix is not None:
+        server = UnixHTTPServer(unix, DecisionHandler)
+    else:
+        server = DecisionHTTPServer((host, port), DecisionHandler)
+    server.batcher = batcher
+    server.result_timeout = result_timeout
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='micro batching decision service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this unix socket path instead')
+    parser.add_argument('--window', type=float, default=0.005,
+                        help='seconds to collect requests for one batch')
+    parser.add_argument('--max-batch', type=int, default=4096)
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='seconds a caller waits for its decision')
+    args = parser.parse_args()
+
+    batcher = DecisionBatcher(window=args.window, max_batch=args.max_batch)
+    server = make_server(batcher, args.host, args.port, args.unix, args.timeout)
+    print('serving on {}'.format(args.unix or '{}:{}'.format(args.host, args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo forecast uncertainty for mode selection.
+
+The hourly forecast is perturbed with autocorrelated (AR(1)) errors into
+an ensemble of trajectories, every mode is simulated against every
+trajectory in one (samples, modes, t) batch, and the modes are ranked
+by expected cost plus a risk term.
+"""
+
+import numpy as np
+from . import simulation as sim
+
+
+def perturb_forecast(T_ambient, rh_ambient, t, samples = 200, t_sigma = 1.0,
+                     rh_sigma = 3.0, correlation = 0.8, seed = None):
+    '''
+    Parameters
+    ----------
+    T_ambient, rh_ambient :
+        forecast temperature and humidity, padded to t like
+        forecast_inside_conditions
+    samples : int
+        ensemble size
+    t_sigma, rh_sigma :
+        standard deviation of the forecast error
+    correlation :
+        step to step correlation of the errors
+    seed :
+        seed for numpy's default_rng, the same seed gives the same ensemble
+
+    Returns
+    -------
+    (T, rh) arrays (samples, t), rh clipped to 0..100 %
+    '''
+    rng = np.random.default_rng(seed)
+    T_ambient  = sim.expand_forecast(T_ambient, t)
+    rh_ambient = sim.expand_forecast(rh_ambient, t)
+    z = rng.standard_normal((2, samples, t))
+    noise = np.empty_like(z)
+    noise[..., 0] = z[..., 0]
+    scale = np.sqrt(1 - correlation**2)
+    for k in range(1, t):
+        noise[..., k] = correlation * noise[..., k-1] + scale * z[..., k]
+    T  = T_ambient + t_sigma * noise[0]
+    rh = np.clip(rh_ambient + rh_sigma * noise[1], 0, 100)
+    return T, rh
+
+
+def score_modes_ensemble(modes, t, T_ambient, rh_ambient, T_house, rh_house,
+                         v_dot_air, v_house, desired_temp, dt = 15,
+                         cooler_efficiency = 0.744, samples = 200,
+                         risk_weight = 1.0, risk = 'std', alpha = 0.9,
+                         seed = None, **perturbation):
+    '''
+    Score every mode against a perturbed forecast ensemble.
+
+    risk is 'std' (standard deviation of the cost) or 'cvar' (mean of
+    the worst 1-alpha fraction of costs minus the expected cost).
+    Extra keyword arguments go to perturb_forecast.
+
+    Returns
+    -------
+    (names, score, expected, risk) arrays over the mode table, where
+    score = expected + risk_weight * risk
+    '''
+    if risk == 'cvar' and not 0 <= alpha < 1:
+        raise ValueError('alpha must be in [0, 1), got {}'.format(alpha))
+    T, rh = perturb_forecast(T_ambient, rh_ambient, t, samples, seed=seed,
+                             **perturbation)
+    names, result = sim.simulate_modes(modes, t, T, rh, T_house, rh_house,
+                                       v_dot_air, v_house, dt, cooler_efficiency)
+    cost = ((result.T_house - desired_temp)**2).sum(axis=-1)   # (samples, modes)
+    expected = cost.mean(axis=0)
+    if risk == 'std':
+        spread = cost.std(axis=0)
+    elif risk == 'cvar':
+        # keep at least the worst sample
+        tail = np.sort(cost, axis=0)[min(int(np.floor(alpha * samples)), samples - 1):]
+        spread = tail.mean(axis=0) - expected
+    else:
+        raise ValueError('unknown risk measure {}'.format(risk))
+    return names, expected + risk_weight * spread, expected, spread
+
+
+def get_auto_setting_ensemble(modes, t, T_ambient, rh_ambient, T_house, rh_house,
+                              v_dot_air, v_house, desired_temp, **kwargs):
+    '''
+    Mode with the lowest risk adjusted score, keyword arguments as
+    score_modes_ensemble.
+    '''
+    names, score, _, _ = score_modes_ensemble(modes, t, T_ambient, rh_ambient,
+                                              T_house, rh_house, v_dot_air,
+                                              v_house, desired_temp, **kwargs)
+    return names[int(np.argmin(score))]
+
+
+if __name__ == '__main__':
+    import time
+    from . import cooler_model as cm
+    T_ambient =[300.0, 302.3, 304.5, 306.4, 307.8, 308.7, 309.0, 308.7, 307.8, 306.4, 304.5, 302.3, 300.0, 297.7, 295.5, 293.6, 292.2, 291.3, 291.0, 291.3, 292.2, 293.6, 295.5, 297.7, 300.0]
+    rh_ambient=[25, 25, 25, 25, 25, 25, 25, 26, 27, 28, 29, 30, 31, 29, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27]
+    modes = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+    start = time.perf_counter()
+    names, score, expected, spread = score_modes_ensemble(
+        modes, 4, T_ambient, rh_ambient, round(cm.c2k(cm.f2c(90))), 30,
+        (0, 70, 106), 10000, cm.c2k(cm.f2c(75)), samples=500, seed=1)
+    print('{:.4f} s'.format(time.perf_counter() - start))
+    for row in zip(names, score, expected, spread):
+        print('{:16s} {:8.1f} {:8.1f} {:8.1f}'.format(*row))
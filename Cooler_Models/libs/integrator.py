@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Continuous time house model with an adaptive step integrator.
+
+remove/mix with a step of exhaust volume is the explicit Euler step of
+
+    dT/dt  = Q / V * (T_exhaust(t)  - T)
+    drh/dt = Q / V * (rh_exhaust(t) - rh)
+
+with Q the cooler air flow. Here the forecast is interpolated linearly
+in time and the equations are integrated with the embedded
+Bogacki-Shampine 3(2) pair, so steps grow while conditions are steady and
+shrink where they change. Mode switches and forecast points are
+breakpoints that no step crosses.
+"""
+
+import numpy as np
+from . import cooler_model as cm
+from . import simulation as sim
+
+
+class IntegrationResult():
+    def __init__(self, t, T_house, rh_house, steps, rejected):
+        self.t        = t
+        self.T_house  = T_house
+        self.rh_house = rh_house
+        # accepted and rejected step counts
+        self.steps    = steps
+        self.rejected = rejected
+
+    def __repr__(self):
+        return "%s(%d steps, %d rejected)" % (self.__class__.__name__,
+                                              self.steps, self.rejected)
+
+
+def integrate_house(T_house, rh_house, v_house, forecast_times, T_ambient, rh_ambient,
+                    switch_times, fans, pumps, v_dot_air, t_eval,
+                    cooler_efficiency = 0.744, rtol = 1e-4, atol = 1e-3,
+                    max_step = np.inf, max_rejected = 50):
+    '''
+    Parameters
+    ----------
+    T_house, rh_house, v_house :
+        starting conditions and volume of the house
+    forecast_times, T_ambient, rh_ambient :
+        forecast points, interpolated linearly between them
+    switch_times, fans, pumps :
+        mode schedule, fans[i]/pumps[i] apply from switch_times[i] on,
+        switch_times[0] is the start time
+    v_dot_air :
+        air flow per fan setting, in volume per time unit
+    t_eval :
+        increasing output times after switch_times[0]
+    rtol, atol :
+        relative and absolute error allowed per step
+    max_step :
+        largest step allowed
+    max_rejected :
+        rejected steps in a row before giving up with RuntimeError
+
+    Returns
+    -------
+    IntegrationResult with the house conditions at t_eval.
+
+    Raises ValueError where the cooler model has no finite outlet
+    conditions, e.g. for ambient temperatures below 0 C.
+    '''
+    forecast_times = np.asarray(forecast_times, dtype=float)
+    T_ambient  = np.asarray(T_ambient, dtype=float)
+    rh_ambient = np.asarray(rh_ambient, dtype=float)
+    switch_times = np.asarray(switch_times, dtype=float)
+    t_eval = np.asarray(t_eval, dtype=float)
+    t = switch_times[0]
+
+    breaks = np.union1d(np.union1d(switch_times, forecast_times), t_eval)
+    breaks = breaks[(breaks > t) & (breaks <= t_eval[-1])]
+
+    def rhs(s, y, rate, efficiency):
+        t_exh, rh_exh = cm.calculate_outlet_temp(np.interp(s, forecast_times, T_ambient),
+                                                 np.interp(s, forecast_times, rh_ambient),
+                                                 efficiency)
+        dy = rate * np.array((t_exh - y[0], rh_exh - y[1]))
+        if not np.all(np.isfinite(dy)):
+            raise ValueError('no finite cooler outlet conditions at t={} (ambient '
+                             'below 0 C?)'.format(s))
+        return dy
+
+    y = np.array((T_house, rh_house), dtype=float)
+    out = np.empty((len(t_eval), 2))
+    n_out = 0
+    steps = rejected = in_a_row = 0
+    h = mode = None
+    for t_next in breaks:
+        previous, mode = mode, np.searchsorted(switch_times, t, side='right') - 1
+        rate = v_dot_air[fans[mode]] / v_house
+        efficiency = cooler_efficiency * pumps[mode]
+        k1 = rhs(t, y, rate, efficiency)
+        if mode != previous:
+            # first guess, about a hundredth of the relaxation time
+            h = 0.01 / rate if rate > 0 else t_next - t
+        while t < t_next:
+            h = min(h, max_step)
+            last = h >= t_next - t
+            if last:
+                h = t_next - t
+            k2 = rhs(t + h/2,   y + h/2   * k1, rate, efficiency)
+            k3 = rhs(t + 3*h/4, y + 3*h/4 * k2, rate, efficiency)
+            y_new = y + h * (2/9 * k1 + 1/3 * k2 + 4/9 * k3)
+            k4 = rhs(t + h, y_new, rate, efficiency)
+            err = h * (-5/72 * k1 + 1/12 * k2 + 1/9 * k3 - 1/8 * k4)
+            scale = atol + rtol * np.maximum(abs(y), abs(y_new))
+            err_norm = np.max(abs(err) / scale)
+            if not np.isfinite(err_norm):
+                raise ValueError('step from t={} gave no finite result'.format(t))
+            factor = min(5.0, max(0.2, 0.9 * err_norm ** (-1/3))) if err_norm > 0 else 5.0
+            if err_norm <= 1:
+                t = t_next if last else t + h
+                y, k1 = y_new, k4
+                steps += 1
+                in_a_row = 0
+            else:
+                rejected += 1
+                in_a_row += 1
+                if in_a_row > max_rejected:
+                    raise RuntimeError('{} steps rejected in a row at t={}, h={}'
+                                       .format(in_a_row, t, h))
+            h *= factor
+        while n_out < len(t_eval) and t_eval[n_out] <= t:
+            out[n_out] = y
+            n_out += 1
+    return IntegrationResult(t_eval, out[:, 0], out[:, 1], steps, rejected)
+
+
+def forecast_inside_conditions_adaptive(t, fan, pump, T_ambient, rh_ambient,
+                                        T_house, rh_house, v_dot_air, v_house,
+                                        dt = 15, cooler_efficiency = 0.744,
+                                        rtol = 1e-4, atol = 1e-3):
+    '''
+    forecast_inside_conditions on the continuous model, the forecast value
+    i is taken to hold at time i*dt and results are reported every dt.
+    Returns a simulation.ForecastResult.
+    '''
+    T_ambient  = sim.expand_forecast(T_ambient, t)
+    rh_ambient = sim.expand_forecast(rh_ambient, t)
+    times = np.arange(t) * dt
+    result = integrate_house(T_house, rh_house, v_house, times, T_ambient, rh_ambient,
+                             [0.0], [fan], [pump], v_dot_air, times + dt,
+                             cooler_efficiency, rtol, atol)
+    T_exhaust, rh_exhaust = sim.exhaust_conditions(T_ambient, rh_ambient, pump, cooler_efficiency)
+    return sim.ForecastResult(np.arange(t), T_ambient, rh_ambient, T_exhaust, rh_exhaust,
+                              result.T_house, result.rh_house)
+
+
+if __name__ == '__main__':
+    hours = np.arange(25) * 3600.0
+    T_ambient = cm.f2c(np.array([80, 84, 88, 92, 95, 98, 100, 101, 100, 98, 95, 92, 88,
+                                 85, 82, 80, 78, 76, 75, 74, 74, 75, 76, 78, 80]))
+    rh_ambient = np.full(25, 20.0)
+    result = integrate_house(cm.f2c(85), 30, 250, hours, T_ambient, rh_ambient,
+                             [0, 6*3600, 18*3600], [0, 2, 0], [0, 1, 0], (0, 2, 3),
+                             hours[1:])
+    print(result)
+    for h, T in zip(result.t / 3600, result.T_house):
+        print('{:4.0f} {:6.1f}'.format(h, cm.c2f(T)))
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Reduced precision backend for small controllers (Pi Zero class).
+
+The cooler_model psychrometrics are evaluated in float32 with the power
+terms read from precomputed tables (linear interpolation), and the house
+is stepped either in float32 or in int32 fixed point (Q8 temperature
+and rh, Q16 mixing fraction). The tables take 70 kB and are built on
+first use.
+
+Select it at runtime, the controller code stays the same:
+
+    simulation.use_backend('float32')    # or 'fixed', 'float64' (reference)
+    houses = simulation.environment_ensemble(T, rh, volume)
+
+or set COOLER_BACKEND before the models are imported.
+
+Accuracy envelope against the float64 reference (accuracy_envelope(),
+ambient 5-50 C, rh 2-80 %, efficiency 0-1, one day forecasts):
+
+    backend   outlet temp   outlet rh   house temp   house rh
+    float32   4e-5 C        1.2e-3 %    6e-5         1.3e-4
+    fixed     4e-5 C        1.2e-3 %    0.02         0.02
+
+The house error of the fixed point stepping comes from its rounding dead
+band: a step moves the state by less than half a Q8 unit when the
+exhaust is within 0.5 / (vol / v_house) units of it, so the house can
+stop short of the exhaust by that much (0.02 degree at 10 % air change
+per step, 0.2 degree at 1 %). Ambient temperatures below 0 (power of a
+negative number) give nan, like the reference.
+"""
+
+import numpy as np
+from . import cooler_model as cm
+
+# NASA TN D-8401 eq 24 saturation term, kelvin
+_SAT_START, _SAT_STEP, _SAT_SIZE = 180.0, 0.125, 5200
+# abdel-faheed eq 9 powers t**1.724, t**1.549, t**0.727, celcius
+_POW_START, _POW_STEP, _POW_SIZE = 0.0, 0.1, 4000
+_POWERS = (1.724, 1.549, 0.727)
+
+FIXED_T  = 8    # fraction bits of temperature and rh
+FIXED_W  = 16   # fraction bits of the mixing fraction
+
+_tables = {}
+
+
+def _table(name):
+    ''' build the lookup tables once, float32 '''
+    if not _tables:
+        T = _SAT_START + _SAT_STEP * np.arange(_SAT_SIZE)
+        _tables['sat'] = cm._saturation_term(T).astype(np.float32)
+        t = _POW_START + _POW_STEP * np.arange(_POW_SIZE)
+        for n in _POWERS:
+            _tables[n] = (t ** n).astype(np.float32)
+    return _tables[name]
+
+
+def table_bytes():
+    _table('sat')
+    return sum(table.nbytes for table in _tables.values())
+
+
+def _lookup(table, start, step, x):
+    ''' linear interpolation in a float32 table, nan outside of it '''
+    pos = (x - np.float32(start)) * np.float32(1 / step)
+    inside = (pos >= 0) & (pos <= len(table) - 1)
+    pos = np.where(inside, pos, 0)
+    i = np.minimum(pos.astype(np.int32), len(table) - 2)
+    frac = pos - i.astype(np.float32)
+    value = table[i] + frac * (table[i + 1] - table[i])
+    return np.where(inside, value, np.float32(np.nan))
+
+
+def saturation_term(T):
+    ''' cooler_model._saturation_term from the table, T kelvin, outside
+    of the table (180-830 K) it is computed in float32 '''
+    T = np.asarray(T, dtype=np.float32)
+    value = _lookup(_table('sat'), _SAT_START, _SAT_STEP, T)
+    missing = np.isnan(value) & ~np.isnan(T)
+    if missing.any():
+        value[missing] = cm._saturation_term(T[missing]).astype(np.float32)
+    return value
+
+
+def U_batch(ta, tw, p=1013.25):
+    ''' cooler_model.U_batch in float32 '''
+    f = np.float32(6.6e-4)
+    g = np.float32(7.570e-7)
+    ta = np.asarray(ta, dtype=np.float32)
+    tw = np.asarray(tw, dtype=np.float32)
+    p = np.float32(p)
+    return (saturation_term(tw) - (f+g*tw) * p * (ta-tw)) / saturation_term(ta)
+
+
+def calculate_t_wet_batch(t_amb, rh):
+    ''' cooler_model.calculate_t_wet_batch in float32, powers from tables '''
+    a1=np.float32(-2.21e-6)
+    b1=np.float32(7.87e-5)
+    a2=np.float32(9.58e-4)
+    b2=np.float32(6.91e-2)
+    a3=np.float32(1.5924)
+    b3=np.float32(-7.843)
+
+    t_amb = np.asarray(t_amb, dtype=np.float32)
+    rh = np.asarray(rh, dtype=np.float32)
+    p1, p2, p3 = [_lookup(_table(n), _POW_START, _POW_STEP, t_amb) for n in _POWERS]
+    return( (a1*p1 + b1) * rh**2 + (a2*p2 + b2) * rh + (a3*p3 + b3) )
+
+
+def calculate_outlet_temp_batch(t_amb, rh, efficiency = 0.75, p=1013.25):
+    ''' cooler_model.calculate_outlet_temp_batch in float32 '''
+    t_amb, rh, efficiency = np.broadcast_arrays(
+        np.asarray(t_amb, dtype=np.float32), np.asarray(rh, dtype=np.float32),
+        np.asarray(efficiency, dtype=np.float32))
+    t_wet = calculate_t_wet_batch(t_amb, rh)
+    t_exh = t_amb - efficiency * (t_amb - t_wet)
+    rh_exh = U_batch(cm.c2k(t_exh), cm.c2k(t_wet), p) * np.float32(100)
+    return(t_exh, rh_exh)
+
+
+def simulate_float32(T_exhaust, rh_exhaust, vol_exhaust, T_house, rh_house, v_house):
+    ''' simulation.simulate with float32 state and buffers '''
+    T_exhaust, rh_exhaust, vol_exhaust = np.broadcast_arrays(
+        np.asarray(T_exhaust, dtype=np.float32), np.asarray(rh_exhaust, dtype=np.float32),
+        np.asarray(vol_exhaust, dtype=np.float32))
+    batch, t = T_exhaust.shape[:-1], T_exhaust.shape[-1]
+    T_out  = np.empty(T_exhaust.shape, dtype=np.float32)
+    rh_out = np.empty(T_exhaust.shape, dtype=np.float32)
+    T  = np.broadcast_to(np.asarray(T_house, dtype=np.float32), batch)
+    rh = np.broadcast_to(np.asarray(rh_house, dtype=np.float32), batch)
+    v_house = np.asarray(v_house, dtype=np.float32)
+    for i in range(t):
+        vol  = vol_exhaust[..., i]
+        keep = v_house - vol
+        tvol = keep + vol
+        rh = (rh * keep + rh_exhaust[..., i] * vol) / tvol
+        T  = (T  * keep + T_exhaust[..., i]  * vol) / tvol
+        T_out[..., i]  = T
+        rh_out[..., i] = rh
+    return T_out, rh_out
+
+
+def to_fixed(x, bits = FIXED_T):
+    return np.round(np.asarray(x, dtype=np.float32) * np.float32(1 << bits)).astype(np.int32)
+
+
+def from_fixed(x, bits = FIXED_T):
+    return (np.asarray(x) / np.float32(1 << bits)).astype(np.float32)
+
+
+def _toward(x, target, w):
+    ''' x + w * (target - x) with Q16 w, rounded half up. The state is
+    int32, only the product of a Q8 difference and a Q16 weight is taken
+    in int64, so steps of any size are exact (no saturation) '''
+    diff = (target - x).astype(np.int64)
+    return x + ((diff * w + (1 << (FIXED_W - 1))) >> FIXED_W).astype(np.int32)
+
+
+def simulate_fixed(T_exhaust, rh_exhaust, vol_exhaust, T_house, rh_house, v_house):
+    '''
+    simulation.simulate in integer fixed point. The house volume is
+    constant, so remove/mix reduces to moving the state the fraction
+    vol / v_house toward the exhaust. Returns float32 arrays.
+    '''
+    T_exhaust, rh_exhaust, vol_exhaust = np.broadcast_arrays(
+        to_fixed(T_exhaust), to_fixed(rh_exhaust), np.asarray(vol_exhaust, dtype=np.float32))
+    batch, t = T_exhaust.shape[:-1], T_exhaust.shape[-1]
+    w = to_fixed(vol_exhaust / np.asarray(v_house, dtype=np.float32)[..., None], FIXED_W)
+    w = np.broadcast_to(w, T_exhaust.shape)
+    T_out  = np.empty(T_exhaust.shape, dtype=np.int32)
+    rh_out = np.empty(T_exhaust.shape, dtype=np.int32)
+    T  = np.broadcast_to(to_fixed(T_house), batch)
+    rh = np.broadcast_to(to_fixed(rh_house), batch)
+    for i in range(t):
+        rh = _toward(rh, rh_exhaust[..., i], w[..., i])
+        T  = _toward(T,  T_exhaust[..., i],  w[..., i])
+        T_out[..., i]  = T
+        rh_out[..., i] = rh
+    return from_fixed(T_out), from_fixed(rh_out)
+
+
+class FixedEnvironmentEnsemble():
+    '''
+    Environment.EnvironmentEnsemble with the temperature and rh held as
+    Q8 integers and the volume as float32, the same mix / remove /
+    advance API. tem and rh read back as float32 arrays.
+    '''
+    def __init__(self, temp, rh, volume):
+        temp, rh, volume = np.broadcast_arrays(temp, rh, volume)
+        self._tem = to_fixed(temp)
+        self._rh  = to_fixed(rh)
+        self.vol  = np.array(volume, dtype=np.float32)
+
+    @property
+    def tem(self):
+        return from_fixed(self._tem)
+
+    @property
+    def rh(self):
+        return from_fixed(self._rh)
+
+    def __len__(self):
+        return len(self._tem)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__, self.__dict__)
+
+    def mix(self, env, where=None):
+        vol = np.broadcast_to(np.asarray(env.vol, dtype=np.float32), self.vol.shape)
+        if where is not None:
+            vol = np.where(where, vol, np.float32(0))
+        tvol = self.vol + vol
+        w = to_fixed(vol / tvol, FIXED_W)
+        self._rh  = _toward(self._rh,  to_fixed(env.rh),  w)
+        self._tem = _toward(self._tem, to_fixed(env.tem), w)
+        self.vol = tvol
+
+    def remove(self, vol, where=None):
+        if where is not None:
+            vol = np.where(where, vol, 0.0)
+        self.vol -= np.float32(vol) if np.isscalar(vol) else np.asarray(vol, dtype=np.float32)
+
+    def advance(self, env, steps, where=None):
+        ''' Environment.EnvironmentEnsemble.advance, the decay factor
+        r**steps is rounded to Q16 once, so this is exact in float and
+        then rounded, not a replay of the stepwise dead band '''
+        steps = np.asarray(steps)
+        if where is not None:
+            steps = np.where(where, steps, 0)
+        r = (self.vol - np.float32(env.vol)) / self.vol
+        decay = np.where(steps > 0, r ** np.maximum(steps, 0), np.float32(1))
+        self._rh  = _toward(self._rh,  to_fixed(env.rh),  to_fixed(1 - decay, FIXED_W))
+        self._tem = _toward(self._tem, to_fixed(env.tem), to_fixed(1 - decay, FIXED_W))
+
+    def advance_segments(self, segments):
+        for env, steps in segments:
+            self.advance(env, steps)
+
+
+class Backend():
+    '''
+    The functions simulation swaps in for a backend. float64 is the
+    reference (cooler_model and simulation's own kernel).
+    '''
+    def __init__(self, name):
+        if name not in BACKENDS:
+            raise ValueError('unknown backend {!r}, one of {}'.format(name, BACKENDS))
+        self.name = name
+        self.calculate_outlet_temp_batch = calculate_outlet_temp_batch
+        self.simulate = simulate_fixed if name == 'fixed' else simulate_float32
+        if name == 'fixed':
+            self.EnvironmentEnsemble = FixedEnvironmentEnsemble
+        else:
+            from . import Environment
+            self.EnvironmentEnsemble = Environment.EnvironmentEnsemble
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.name)
+
+
+BACKENDS = ('float32', 'fixed')
+
+
+def accuracy_envelope(n = 20000, t = 96, seed = 0):
+    '''
+    Largest absolute difference to the float64 reference for random
+    inputs: {'outlet_temp', 'outlet_rh', backend: {'house_temp', 'house_rh'}}
+    '''
+    from . import simulation as sim
+    rng = np.random.default_rng(seed)
+    t_amb = rng.uniform(5, 50, n)
+    rh = rng.uniform(2, 80, n)
+    eff = rng.uniform(0, 1, n)
+    T_ref, rh_ref = cm.calculate_outlet_temp_batch(t_amb, rh, eff)
+    T_lite, rh_lite = calculate_outlet_temp_batch(t_amb, rh, eff)
+    result = {'outlet_temp': float(np.max(abs(T_lite - T_ref))),
+              'outlet_rh':   float(np.max(abs(rh_lite - rh_ref)))}
+
+    houses = 200
+    T_exh = rng.uniform(10, 45, (houses, t))
+    rh_exh = rng.uniform(5, 95, (houses, t))
+    vol = rng.uniform(0, 0.3, (houses, 1)) * 10000
+    T0 = rng.uniform(15, 40, houses)
+    rh0 = rng.uniform(5, 95, houses)
+    T_ref, rh_ref = sim.simulate(T_exh, rh_exh, vol, T0, rh0, 10000)
+    for name in BACKENDS:
+        T_lite, rh_lite = Backend(name).simulate(T_exh, rh_exh, vol, T0, rh0, 10000)
+        result[name] = {'house_temp': float(np.max(abs(T_lite - T_ref))),
+                        'house_rh':   float(np.max(abs(rh_lite - rh_ref)))}
+    return result
+
+
+if __name__ == '__main__':
+    import json
+    print('tables {} bytes'.format(table_bytes()))
+    print(json.dumps(accuracy_envelope(), indent=4))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Reading saved weather.gov hourly forecasts (the json the Flask application
+writes to tmp/weather_forecast.txt) into arrays for the cooler models, and
+resampling them onto the time grid of a simulation.
+
+The forecast_inside_conditions functions take one forecast value per
+step, so hourly data should go through Forecast.grid(start, dt, n) rather
+than being repeated or cycled. They also take a Forecast in place of
+T_ambient and resample it themselves:
+
+    T, rh = Forecast.from_file(path).grid(now, 15, 96)
+    forecast_inside_conditions_fast(96, fan, pump, T, rh, ...)
+    forecast_inside_conditions_fast(96, fan, pump, forecast, None, ..., start=now)
+"""
+
+import json
+import numbers
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from . import cooler_model as cm
+
+
+def load_forecast(path, default_rh=25):
+    '''
+    Parameters
+    ----------
+    path :
+        hourly forecast json from api.weather.gov
+    default_rh :
+        relative humidity % used when the forecast has none
+
+    Returns
+    -------
+    (times, T, rh) arrays of period start times (datetime, timezone aware),
+    temperatures in kelvin and relative humidity in %.
+    '''
+    with open(path) as f:
+        periods = json.load(f)['properties']['periods']
+
+    times = np.array([datetime.fromisoformat(p['startTime']) for p in periods])
+    T = np.array([p['temperature'] for p in periods], dtype=float)
+    if periods and periods[0].get('temperatureUnit', 'F') == 'F':
+        T = cm.f2c(T)
+    rh = [(p.get('relativeHumidity') or {}).get('value') for p in periods]
+    rh = np.array([default_rh if v is None else v for v in rh], dtype=float)
+    return times, cm.c2k(T), rh
+
+
+def to_epoch(times):
+    '''
+    Seconds since the epoch for datetimes or ISO 8601 strings such as the
+    weather.gov startTime ("2021-02-10T20:00:00-07:00"). Timezone aware
+    values are exact, naive ones are taken as local time.
+    '''
+    return np.array([(datetime.fromisoformat(t) if isinstance(t, str) else t).timestamp()
+                     for t in times], dtype=float)
+
+
+def _pchip_slopes(x, y):
+    ''' Fritsch-Carlson slopes, keep the cubic monotone between points '''
+    h = np.diff(x)
+    delta = np.diff(y) / h
+    m = np.empty_like(y)
+    m[0], m[-1] = delta[0], delta[-1]
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    same_sign = delta[:-1] * delta[1:] > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+    m[1:-1] = np.where(same_sign, harmonic, 0.0)
+    return m
+
+
+def interpolate(x, y, xq, method='linear'):
+    '''
+    Interpolate y(x) at xq, 'linear' or monotone cubic 'pchip'.
+    Outside x the end values are held.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    xq = np.clip(np.asarray(xq, dtype=float), x[0], x[-1])
+    if method == 'linear' or len(x) < 3:
+        return np.interp(xq, x, y)
+    if method != 'pchip':
+        raise ValueError('unknown interpolation method {}'.format(method))
+    m = _pchip_slopes(x, y)
+    i = np.clip(np.searchsorted(x, xq, side='right') - 1, 0, len(x) - 2)
+    h = x[i+1] - x[i]
+    s = (xq - x[i]) / h
+    h00 = (1 + 2*s) * (1 - s)**2
+    h10 = s * (1 - s)**2
+    h01 = s**2 * (3 - 2*s)
+    h11 = s**2 * (s - 1)
+    return h00 * y[i] + h10 * h * m[i] + h01 * y[i+1] + h11 * h * m[i+1]
+
+
+class Forecast():
+    '''
+    Timestamped forecast resampled onto simulation grids. The last
+    max_grids grids are cached per (start, dt, n, method), so repeated
+    forecasts over the same horizon only interpolate once.
+    '''
+    def __init__(self, times, T, rh, max_grids = 32):
+        self.times = to_epoch(times)
+        self.T  = np.asarray(T, dtype=float)
+        self.rh = np.asarray(rh, dtype=float)
+        self.max_grids = max_grids
+        self._grids = OrderedDict()
+
+    @classmethod
+    def from_file(cls, path, default_rh=25):
+        return cls(*load_forecast(path, default_rh))
+
+    def grid(self, start, dt, n, method='linear'):
+        '''
+        Parameters
+        ----------
+        start :
+            first grid time, datetime, ISO string or epoch seconds,
+            defaults to the first forecast time when None
+        dt :
+            grid step in minutes
+        n :
+            number of grid points
+        method :
+            'linear' or 'pchip' (monotone cubic)
+
+        Returns
+        -------
+        (T, rh) arrays of length n, grid points after the last forecast
+        time hold its values. A start outside the forecast raises
+        ValueError rather than holding an end value over the whole grid.
+        '''
+        if start is None:
+            start = self.times[0]
+        elif not isinstance(start, numbers.Real):
+            start = to_epoch([start])[0]
+        if not self.times[0] <= start <= self.times[-1]:
+            raise ValueError('start {} is outside of the forecast {} - {}'.format(
+                datetime.fromtimestamp(start), datetime.fromtimestamp(self.times[0]),
+                datetime.fromtimestamp(self.times[-1])))
+        key = (float(start), float(dt), int(n), method)
+        if key in self._grids:
+            self._grids.move_to_end(key)
+        else:
+            t = float(start) + np.arange(n) * dt * 60
+            self._grids[key] = (interpolate(self.times, self.T, t, method),
+                                np.clip(interpolate(self.times, self.rh, t, method), 0, 100))
+            if len(self._grids) > self.max_grids:
+                self._grids.popitem(last=False)
+        return self._grids[key]
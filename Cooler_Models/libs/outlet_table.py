@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Table driven replacement for cooler_model.calculate_outlet_temp.
+
+The exact outlet conditions are evaluated once on a regular
+(t_amb, rh, efficiency) grid and queries are answered by trilinear
+interpolation, so no power terms are evaluated at run time.
+
+With the default grid (1 C, 2 %, 0.05 efficiency steps over
+10..55 C, 2..100 %, 0..1) the maximum error against the exact formula,
+measured at the cell centres, is below 0.01 C for the outlet temperature
+and below 0.3 % for the outlet relative humidity. The measured values for
+any grid are kept in OutletTable.max_error.
+"""
+
+import numpy as np
+from . import cooler_model as cm
+
+
+class OutletTable():
+    def __init__(self, t_range=(10, 55, 1.0), rh_range=(2, 100, 2.0),
+                 eff_range=(0, 1, 0.05)):
+        '''
+        Build the table.
+
+        Parameters
+        ----------
+        t_range : (start, stop, step) ambient temperature celcius
+        rh_range : (start, stop, step) relative humidity %
+        eff_range : (start, stop, step) cooler efficiency decimal
+        '''
+        self.t_axis   = self._axis(*t_range)
+        self.rh_axis  = self._axis(*rh_range)
+        self.eff_axis = self._axis(*eff_range)
+        t, rh, eff = np.meshgrid(self.t_axis, self.rh_axis, self.eff_axis,
+                                 indexing='ij')
+        self.t_exh, self.rh_exh = cm.calculate_outlet_temp_batch(t, rh, eff)
+        self._prepare()
+        self.max_error = self.measure_error()
+
+    @staticmethod
+    def _axis(start, stop, step):
+        n = int(round((stop - start) / step)) + 1
+        return np.linspace(start, start + (n - 1) * step, n)
+
+    def _prepare(self):
+        ''' cache the scalars the lookup path needs '''
+        self._origin = (float(self.t_axis[0]), float(self.rh_axis[0]),
+                        float(self.eff_axis[0]))
+        self._step = (float(self.t_axis[1] - self.t_axis[0]),
+                      float(self.rh_axis[1] - self.rh_axis[0]),
+                      float(self.eff_axis[1] - self.eff_axis[0]))
+        self._shape = self.t_exh.shape
+        self._t_list  = self.t_exh.ravel().tolist()
+        self._rh_list = self.rh_exh.ravel().tolist()
+
+    def save(self, path):
+        ''' store the table in a numpy .npz file '''
+        np.savez(path, t_axis=self.t_axis, rh_axis=self.rh_axis,
+                 eff_axis=self.eff_axis, t_exh=self.t_exh, rh_exh=self.rh_exh,
+                 max_error=np.array(self.max_error))
+
+    @classmethod
+    def load(cls, path):
+        ''' load a table written by save without recomputing it '''
+        data = np.load(path)
+        table = cls.__new__(cls)
+        table.t_axis   = data['t_axis']
+        table.rh_axis  = data['rh_axis']
+        table.eff_axis = data['eff_axis']
+        table.t_exh    = data['t_exh']
+        table.rh_exh   = data['rh_exh']
+        table.max_error = tuple(float(e) for e in data['max_error'])
+        table._prepare()
+        return table
+
+    def _locate(self, x, axis):
+        ''' index of the lower grid point and the fraction towards the next,
+        queries outside the table are clamped to its edges '''
+        x = np.clip((np.asarray(x, dtype=float) - self._origin[axis])
+                    / self._step[axis], 0, self._shape[axis] - 1)
+        i = np.minimum(x.astype(int), self._shape[axis] - 2)
+        return i, x - i
+
+    def interpolate(self, t_amb, rh, efficiency=0.75):
+        '''
+        Array lookup, arguments are broadcast against each other.
+        t_amb - ambient temperature celcius, rh - relative humidity %
+        return (t_exh, rh_exh) arrays like calculate_outlet_temp_batch
+        '''
+        t_amb, rh, efficiency = np.broadcast_arrays(t_amb, rh, efficiency)
+        i, fi = self._locate(t_amb, 0)
+        j, fj = self._locate(rh, 1)
+        k, fk = self._locate(efficiency, 2)
+        out = []
+        for grid in (self.t_exh, self.rh_exh):
+            c00 = grid[i, j, k]     * (1-fk) + grid[i, j, k+1]     * fk
+            c01 = grid[i, j+1, k]   * (1-fk) + grid[i, j+1, k+1]   * fk
+            c10 = grid[i+1, j, k]   * (1-fk) + grid[i+1, j, k+1]   * fk
+            c11 = grid[i+1, j+1, k] * (1-fk) + grid[i+1, j+1, k+1] * fk
+            c0 = c00 * (1-fj) + c01 * fj
+            c1 = c10 * (1-fj) + c11 * fj
+            out.append(c0 * (1-fi) + c1 * fi)
+        return tuple(out)
+
+    def calculate_outlet_temp(self, t_amb, rh, efficiency=0.75):
+        '''
+        Scalar lookup in plain python, drop in for
+        cooler_model.calculate_outlet_temp.
+        t_amb - ambient temperature celcius, rh - relative humidity %
+        return (t_exh, rh_exh)
+        '''
+        nt, nr, ne = self._shape
+        x = min(max((t_amb - self._origin[0]) / self._step[0], 0), nt - 1)
+        y = min(max((rh - self._origin[1]) / self._step[1], 0), nr - 1)
+        z = min(max((efficiency - self._origin[2]) / self._step[2], 0), ne - 1)
+        i = min(int(x), nt - 2)
+        j = min(int(y), nr - 2)
+        k = min(int(z), ne - 2)
+        fi, fj, fk = x - i, y - j, z - k
+
+        base = (i * nr + j) * ne + k
+        di, dj = nr * ne, ne
+        out = []
+        for g in (self._t_list, self._rh_list):
+            c00 = g[base]         + (g[base+1]         - g[base])         * fk
+            c01 = g[base+dj]      + (g[base+dj+1]      - g[base+dj])      * fk
+            c10 = g[base+di]      + (g[base+di+1]      - g[base+di])      * fk
+            c11 = g[base+di+dj]   + (g[base+di+dj+1]   - g[base+di+dj])   * fk
+            c0 = c00 + (c01 - c00) * fj
+            c1 = c10 + (c11 - c10) * fj
+            out.append(c0 + (c1 - c0) * fi)
+        return(out[0], out[1])
+
+    def measure_error(self):
+        '''
+        Compare the interpolation against the exact formula at every cell
+        centre, where trilinear interpolation is furthest from the grid.
+        return (max temperature error celcius, max rh error %)
+        '''
+        mid = [(a[:-1] + a[1:]) / 2 for a in
+               (self.t_axis, self.rh_axis, self.eff_axis)]
+        t, rh, eff = np.meshgrid(*mid, indexing='ij')
+        t_exact, rh_exact = cm.calculate_outlet_temp_batch(t, rh, eff)
+        t_tab, rh_tab = self.interpolate(t, rh, eff)
+        return (float(np.nanmax(abs(t_tab - t_exact))),
+                float(np.nanmax(abs(rh_tab - rh_exact))))
+
+
+if __name__ == '__main__':
+    table = OutletTable()
+    print(table.max_error)
+    for t_amb in range(75, 130, 5):
+        print('{}'.format(t_amb), end='')
+        for rh in (5, 20, 40):
+            t_exh, rh_exh = table.calculate_outlet_temp(cm.f2c(t_amb), rh, 0.75)
+            print('\t{:.0f}'.format(cm.c2f(t_exh)), end='')
+        print()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Receding horizon planner over sequences of cooler modes.
+
+get_auto_setting holds one mode for the whole forecast. plan_modes instead
+searches mode sequences over a long horizon (e.g. 96 steps of 15 minutes)
+with a beam search: every step each kept trajectory is extended by every
+mode, trajectories that land in the same quantized house state with the
+same last mode are merged keeping the cheapest (dynamic programming over
+the discretized state), and the beam_width cheapest survive. Only the
+first mode of the plan is meant to be applied before planning again.
+"""
+
+import time
+import numpy as np
+from . import simulation as sim
+
+
+class Plan():
+    ''' Result of plan_modes '''
+    def __init__(self, modes, T_house, rh_house, cost, complete=True):
+        self.modes    = modes
+        self.T_house  = T_house
+        self.rh_house = rh_house
+        self.cost     = cost
+        # False when the time budget forced the tail to be planned greedily
+        self.complete = complete
+
+    @property
+    def first_mode(self):
+        return self.modes[0]
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__, self.__dict__)
+
+
+def plan_modes(modes, horizon, T_ambient, rh_ambient, T_house, rh_house,
+               v_dot_air, v_house, desired_temp, dt = 15, cooler_efficiency = 0.744,
+               beam_width = 64, t_quantum = 0.05, rh_quantum = 0.5,
+               switch_penalty = 0.0, time_budget = None):
+    '''
+    Search for the mode sequence with the lowest summed squared error to
+    desired_temp over the horizon.
+
+    Parameters
+    ----------
+    modes :
+        mode table, see simulation.mode_settings
+    horizon : int
+        number of dt steps to plan, at least 1
+    T_ambient, rh_ambient, T_house, rh_house, v_dot_air, v_house :
+        as for forecast_inside_conditions
+    desired_temp :
+        target house temperature
+    beam_width : int
+        trajectories kept after each step
+    t_quantum, rh_quantum :
+        bin sizes used to merge trajectories reaching the same state
+    switch_penalty :
+        cost added every time the mode changes
+    time_budget : float
+        seconds allowed for the search, once spent the remaining steps
+        are planned with a beam of one (greedy)
+
+    Returns
+    -------
+    Plan with the mode names per step and the planned house trajectory.
+    '''
+    if horizon < 1:
+        raise ValueError('horizon must be at least 1 step, got {}'.format(horizon))
+    start = time.perf_counter()
+    names, flow, pump = sim.mode_settings(modes, v_dot_air)
+    n_modes = len(names)
+    T_ambient  = sim.expand_forecast(T_ambient, horizon)
+    rh_ambient = sim.expand_forecast(rh_ambient, horizon)
+    T_exhaust, rh_exhaust = sim.exhaust_conditions(
+        T_ambient, rh_ambient, pump[:, None], cooler_efficiency)
+    vol  = flow * dt
+    keep = v_house - vol
+    tvol = keep + vol
+
+    T    = np.array([T_house], dtype=float)
+    rh   = np.array([rh_house], dtype=float)
+    cost = np.zeros(1)
+    last = np.full(1, -1)
+    parents, choices, T_hist, rh_hist = [], [], [], []
+    complete = True
+    width = beam_width
+
+    for k in range(horizon):
+        if time_budget is not None and width > 1 and \
+           time.perf_counter() - start > time_budget:
+            width = 1
+            complete = False
+        # extend every trajectory by every mode, shape (beam, modes)
+        T_new  = (T[:, None]  * keep + T_exhaust[:, k]  * vol) / tvol
+        rh_new = (rh[:, None] * keep + rh_exhaust[:, k] * vol) / tvol
+        mode   = np.broadcast_to(np.arange(n_modes), T_new.shape)
+        c_new  = cost[:, None] + (T_new - desired_temp)**2 \
+                 + switch_penalty * ((mode != last[:, None]) & (last[:, None] >= 0))
+        parent = np.broadcast_to(np.arange(len(T))[:, None], T_new.shape)
+
+        T_new, rh_new, c_new = T_new.ravel(), rh_new.ravel(), c_new.ravel()
+        mode, parent = mode.ravel(), parent.ravel()
+
+        # merge trajectories in the same state bin, cheapest first
+        order = np.argsort(c_new, kind='stable')
+        keys = np.stack((np.round(T_new / t_quantum), np.round(rh_new / rh_quantum),
+                         mode), axis=1)[order]
+        _, first = np.unique(keys, axis=0, return_index=True)
+        survivors = order[np.sort(first)][:width]
+
+        T, rh, cost = T_new[survivors], rh_new[survivors], c_new[survivors]
+        last = mode[survivors]
+        parents.append(parent[survivors])
+        choices.append(last)
+        T_hist.append(T)
+        rh_hist.append(rh)
+
+    # walk back from the cheapest final trajectory
+    i = int(np.argmin(cost))
+    best_cost = float(cost[i])
+    seq = np.empty(horizon, dtype=int)
+    T_plan  = np.empty(horizon)
+    rh_plan = np.empty(horizon)
+    for k in range(horizon - 1, -1, -1):
+        seq[k], T_plan[k], rh_plan[k] = choices[k][i], T_hist[k][i], rh_hist[k][i]
+        i = parents[k][i]
+    return Plan([names[m] for m in seq], T_plan, rh_plan, best_cost, complete)
+
+
+if __name__ == '__main__':
+    from . import cooler_model as cm
+    T_ambient =[300.0, 302.3, 304.5, 306.4, 307.8, 308.7, 309.0, 308.7, 307.8, 306.4, 304.5, 302.3, 300.0, 297.7, 295.5, 293.6, 292.2, 291.3, 291.0, 291.3, 292.2, 293.6, 295.5, 297.7, 300.0]
+    rh_ambient=[25, 25, 25, 25, 25, 25, 25, 26, 27, 28, 29, 30, 31, 29, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27]
+    modes = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+    plan = plan_modes(modes, 96, np.repeat(T_ambient, 4), np.repeat(rh_ambient, 4),
+                      round(cm.c2k(cm.f2c(90))), 30, (0, 70, 106), 10000,
+                      cm.c2k(cm.f2c(75)), time_budget=0.5)
+    print(plan.first_mode, plan.cost, plan.complete)
+    print(plan.modes)
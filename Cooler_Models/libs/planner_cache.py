@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental re-planning cache for the auto setting controller.
+
+For a constant mode the house after k+1 remove/mix steps is
+
+    T_k = r**(k+1) * T_0 + F_k,   F_k = sum_j r**(k-j) * (1-r) * Te_j
+
+with r = (v_house - vol) / v_house. The forced part F depends only on the
+forecast window, so it is cached per window and the house state only
+enters through r**(k+1). When the window moves on by one step
+(new[:-1] == old[1:]) F is shifted in place and just the newly exposed
+tail step is simulated. Decisions themselves are cached on the quantized
+house state plus the window, both caches evict least recently used.
+"""
+
+from collections import OrderedDict
+import numpy as np
+from . import simulation as sim
+
+
+class PlannerCache():
+    def __init__(self, modes, horizon, v_dot_air, v_house, desired_temp,
+                 dt = 15, cooler_efficiency = 0.744, maxsize = 256,
+                 t_quantum = 0.05, rh_quantum = 0.5, refresh = 64):
+        '''
+        Parameters
+        ----------
+        modes, horizon, v_dot_air, v_house, desired_temp, dt, cooler_efficiency :
+            as for final_model.score_modes
+        maxsize : int
+            entries kept in each LRU cache
+        t_quantum, rh_quantum :
+            house state bins for reusing decisions
+        refresh : int
+            incremental shifts after which the forced response is
+            recomputed from scratch to stop rounding errors building up
+        '''
+        self.names, flow, self.pump = sim.mode_settings(modes, v_dot_air)
+        self.horizon = horizon
+        self.desired_temp = desired_temp
+        self.cooler_efficiency = cooler_efficiency
+        self.maxsize = maxsize
+        self.t_quantum = t_quantum
+        self.rh_quantum = rh_quantum
+        self.refresh = refresh
+
+        vol = flow * dt
+        self.r = (v_house - vol) / v_house
+        # r**(k+1) for every mode and step, shape (modes, horizon)
+        self.decay = self.r[:, None] ** np.arange(1, horizon + 1)
+        self._decisions = OrderedDict()
+        self._forced = OrderedDict()
+        self._last = None
+        self.hits = 0
+        self.misses = 0
+        self.tail_updates = 0
+        self.full_updates = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'tail_updates': self.tail_updates,
+                'full_updates': self.full_updates,
+                'decisions': len(self._decisions), 'windows': len(self._forced)}
+
+    def clear(self):
+        self._decisions.clear()
+        self._forced.clear()
+        self._last = None
+
+    def _put(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def _forced_response(self, T_ambient, rh_ambient):
+        ''' forced (T, rh) responses for the window, shape (modes, horizon) '''
+        key = (T_ambient.tobytes(), rh_ambient.tobytes())
+        if key in self._forced:
+            self._forced.move_to_end(key)
+            return self._forced[key]
+
+        last = self._last
+        r = self.r[:, None]
+        if last is not None and last[3] < self.refresh and \
+           np.array_equal(last[0][1:], T_ambient[:-1]) and \
+           np.array_equal(last[1][1:], rh_ambient[:-1]):
+            # window moved on one step, only the tail is new
+            (F_T, F_rh), shifts, e0 = last[2], last[3] + 1, last[4]
+            T_exhaust, rh_exhaust = sim.exhaust_conditions(
+                T_ambient[-1], rh_ambient[-1], self.pump, self.cooler_efficiency)
+            F_T  = F_T[:, 1:]  - self.decay[:, :-1] * (1 - r) * e0[0][:, None]
+            F_rh = F_rh[:, 1:] - self.decay[:, :-1] * (1 - r) * e0[1][:, None]
+            F_T  = np.concatenate((F_T,  (r[:, 0] * F_T[:, -1]  + (1 - r[:, 0]) * T_exhaust)[:, None]), axis=1)
+            F_rh = np.concatenate((F_rh, (r[:, 0] * F_rh[:, -1] + (1 - r[:, 0]) * rh_exhaust)[:, None]), axis=1)
+            exhaust0 = sim.exhaust_conditions(
+                T_ambient[0], rh_ambient[0], self.pump, self.cooler_efficiency)
+            self.tail_updates += 1
+        else:
+            T_exhaust, rh_exhaust = sim.exhaust_conditions(
+                T_ambient, rh_ambient, self.pump[:, None], self.cooler_efficiency)
+            vol = 1 - self.r
+            F_T, F_rh = sim.simulate(T_exhaust, rh_exhaust, vol[:, None], 0.0, 0.0, 1.0)
+            exhaust0 = (T_exhaust[:, 0], rh_exhaust[:, 0])
+            shifts = 0
+            self.full_updates += 1
+
+        forced = (F_T, F_rh)
+        self._last = (T_ambient, rh_ambient, forced, shifts, exhaust0)
+        self._put(self._forced, key, forced)
+        return forced
+
+    def decide(self, T_ambient, rh_ambient, T_house, rh_house):
+        '''
+        get_auto_setting style decision for the current state and the
+        forecast window starting now.
+
+        Returns
+        -------
+        (best_mode, scores) with scores an array in mode table order.
+        '''
+        T_ambient  = sim.expand_forecast(T_ambient, self.horizon)
+        rh_ambient = sim.expand_forecast(rh_ambient, self.horizon)
+        window = (T_ambient.tobytes(), rh_ambient.tobytes())
+        key = (round(T_house / self.t_quantum), round(rh_house / self.rh_quantum), window)
+        if key in self._decisions:
+            self.hits += 1
+            self._decisions.move_to_end(key)
+            return self._decisions[key]
+        self.misses += 1
+
+        F_T, F_rh = self._forced_response(T_ambient, rh_ambient)
+        T = self.decay * T_house + F_T
+        scores = ((T - self.desired_temp)**2).sum(axis=-1)
+        best = int(np.argmin(scores))
+        result = (self.names[best], scores)
+        self._put(self._decisions, key, result)
+        return result
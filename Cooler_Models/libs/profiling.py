@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Opt in timing of the model hot paths.
+
+Functions marked with @profiled are left untouched while profiling is
+off, so there is no overhead at all. enable() (or COOLER_PROFILE=1 in the
+environment before the models are imported) swaps them for timing
+wrappers in their module or class, disable() puts the originals back.
+Calls made through references taken before enable() are not timed.
+
+Per function the registry keeps the call count, total and max time and
+a fixed size random sample (reservoir) of the call durations, so memory
+stays bounded however long profiling runs. The registry is updated under
+a lock, profiled functions may run on several threads (the decision
+service). report() gives count, total and percentile latencies as a dict
+(json ready), dump_folded() writes the nested calls in the folded stack
+format flamegraph.pl and speedscope read.
+"""
+
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+_targets = {}           # name -> (module, qualname, original function)
+_stats = {}             # name -> [count, total, max, reservoir of seconds]
+_folded = {}            # "outer;inner" -> self time in seconds
+_local = threading.local()
+_lock = threading.Lock()    # guards _stats, _folded and _random
+_enabled = False
+_random = random.Random(0)
+
+RESERVOIR = 4096        # durations kept per function for the percentiles
+
+
+def _name(func):
+    return '{}.{}'.format(func.__module__, func.__qualname__)
+
+
+def _owner(module, qualname):
+    ''' module or class holding the function, and its attribute name '''
+    owner = sys.modules.get(module)
+    *path, attr = qualname.split('.')
+    for part in path:
+        owner = getattr(owner, part, None)
+    return owner, attr
+
+
+def _wrap(name, func):
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append([name, 0.0])
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            frame = stack.pop()
+            key = ';'.join([f[0] for f in stack] + [name])
+            with _lock:
+                _record(name, elapsed)
+                _folded[key] = _folded.get(key, 0.0) + elapsed - frame[1]
+            if stack:
+                stack[-1][1] += elapsed
+    return timed
+
+
+def _record(name, elapsed):
+    ''' add one call to the registry, the caller holds _lock '''
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = [0, 0.0, 0.0, []]
+    stats[0] += 1
+    stats[1] += elapsed
+    stats[2] = max(stats[2], elapsed)
+    reservoir = stats[3]
+    if len(reservoir) < RESERVOIR:
+        reservoir.append(elapsed)
+    else:
+        # every call ends up in the reservoir with the same probability
+        i = _random.randrange(stats[0])
+        if i < RESERVOIR:
+            reservoir[i] = elapsed
+
+
+def profiled(func):
+    ''' mark a function or method as a hot path '''
+    name = _name(func)
+    _targets[name] = (func.__module__, func.__qualname__, func)
+    return _wrap(name, func) if _enabled else func
+
+
+def _install(wrapped):
+    for name, (module, qualname, func) in _targets.items():
+        owner, attr = _owner(module, qualname)
+        if owner is not None and hasattr(owner, attr):
+            setattr(owner, attr, _wrap(name, func) if wrapped else func)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    _install(True)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _install(False)
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _folded.clear()
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+def report():
+    ''' {name: {count, total, mean, p50, p90, p99, max}} in seconds,
+    the percentiles come from the reservoir sample '''
+    result = {}
+    with _lock:
+        stats = [(name, count, total, longest, list(reservoir))
+                 for name, (count, total, longest, reservoir) in _stats.items()]
+    for name, count, total, longest, reservoir in stats:
+        values = sorted(reservoir)
+        result[name] = {'count': count,
+                        'total': total,
+                        'mean':  total / count,
+                        'p50':   _percentile(values, 50),
+                        'p90':   _percentile(values, 90),
+                        'p99':   _percentile(values, 99),
+                        'max':   longest}
+    return result
+
+
+def dump_json(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=4, sort_keys=True)
+
+
+def dump_folded(path):
+    ''' folded stacks, one "outer;inner microseconds" line per call path '''
+    with _lock:
+        folded = sorted(_folded.items())
+    with open(path, 'w') as f:
+        for stack, seconds in folded:
+            f.write('{} {}\n'.format(stack, int(round(seconds * 1e6))))
+
+
+if os.environ.get('COOLER_PROFILE', '').lower() not in ('', '0', 'false', 'no'):
+    _enabled = True
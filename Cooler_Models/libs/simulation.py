@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Array kernel behind forecast_inside_conditions.
+
+The house is stepped with the same remove/mix arithmetic as Environment,
+but every quantity is an array so whole forecasts (and batches of them)
+are written into preallocated buffers instead of python lists.
+"""
+
+import os
+import numpy as np
+from . import cooler_model as cm
+from .profiling import profiled
+
+# cooler operating modes, fan indexes v_dot_air, pump 0=off 1=on
+MODES={
+    'Off':            {'fan':0, 'pump':0},
+    'Fan Hi':         {'fan':2, 'pump':0},
+    'Fan Lo':         {'fan':1, 'pump':0},
+    'Fan Hi (w/Pump)':{'fan':2, 'pump':1},
+    'Fan Lo (w/Pump)':{'fan':1, 'pump':1},
+    'Pump':           {'fan':0, 'pump':1}
+}
+
+
+# None is the float64 reference, see lite_model for the others
+_backend = None
+
+
+def use_backend(name = 'float64'):
+    '''
+    Switch exhaust_conditions, simulate and environment_ensemble (and so
+    every forecast and mode selection built on them) to 'float64',
+    'float32' or 'fixed'.
+    '''
+    global _backend
+    if name == 'float64':
+        _backend = None
+    else:
+        from . import lite_model
+        _backend = lite_model.Backend(name)
+
+
+def get_backend():
+    return 'float64' if _backend is None else _backend.name
+
+
+def environment_ensemble(temp, rh, volume):
+    '''
+    Environment.EnvironmentEnsemble for the selected backend, the 'fixed'
+    one keeps temperature and rh in fixed point behind the same mix /
+    remove / advance API (lite_model.FixedEnvironmentEnsemble).
+    '''
+    if _backend is None:
+        from .Environment import EnvironmentEnsemble
+        return EnvironmentEnsemble(temp, rh, volume)
+    return _backend.EnvironmentEnsemble(temp, rh, volume)
+
+
+class ForecastResult():
+    '''
+    Lightweight result of a forecast, one array per column.
+    Use to_frame() to get the pandas data frame the old API returned.
+    '''
+    columns = ('time', 'T_amb',  'rh_amb', 'T_ext',  'rh_ext', 'T_house', 'rh_house')
+
+    def __init__(self, time, T_amb, rh_amb, T_ext, rh_ext, T_house, rh_house):
+        self.time     = time
+        self.T_amb    = T_amb
+        self.rh_amb   = rh_amb
+        self.T_ext    = T_ext
+        self.rh_ext   = rh_ext
+        self.T_house  = T_house
+        self.rh_house = rh_house
+
+    def __repr__(self):
+        return "%s(%d steps)" % (self.__class__.__name__, len(self.time))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    def to_frame(self):
+        ''' build the pandas data frame, only for single (1-D) forecasts '''
+        import pandas as pd
+        return pd.DataFrame({c: getattr(self, c) for c in self.columns},
+                            columns=self.columns)
+
+
+def expand_forecast(values, t):
+    '''
+    Forecast values as an array of length t. Scalars are repeated and
+    short lists are cycled, the same padding forecast_inside_conditions
+    has always used.
+    '''
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 0:
+        return np.full(t, float(values))
+    if values.shape[-1] < t:
+        reps = [1] * (values.ndim - 1) + [t // values.shape[-1] + 1]
+        values = np.tile(values, reps)
+    return values[..., :t]
+
+
+def forecast_values(T_ambient, rh_ambient, t, dt = 15, start = None):
+    '''
+    (T_ambient, rh_ambient) arrays of length t. T_ambient may instead be
+    an nws_forecast.Forecast, which is resampled every dt minutes from
+    start (its first time when None) and rh_ambient is not used.
+    Otherwise the values are padded as by expand_forecast.
+    '''
+    if hasattr(T_ambient, 'grid'):
+        return T_ambient.grid(start, dt, t)
+    return expand_forecast(T_ambient, t), expand_forecast(rh_ambient, t)
+
+
+def exhaust_conditions(T_ambient, rh_ambient, pump, cooler_efficiency=0.744, site=None,
+                       kelvin=False):
+    '''
+    Cooler output for every forecast step, pump broadcasts against the
+    forecast so a (modes, 1) pump array gives a (modes, t) result.
+    site - optional site_model.Site, psychrometrics at its pressure (float64
+    only, a reduced precision backend raises ValueError)
+    kelvin - T_ambient and the returned exhaust temperature are kelvin,
+    otherwise celcius as cooler_model expects
+    '''
+    if site is not None:
+        if _backend is not None:
+            raise ValueError('site psychrometrics need the float64 backend, '
+                             'not {!r}'.format(_backend.name))
+        calculate = site.calculate_outlet_temp
+    elif _backend is None:
+        calculate = cm.calculate_outlet_temp_batch
+    else:
+        calculate = _backend.calculate_outlet_temp_batch
+    if kelvin:
+        T_ambient = cm.k2c(np.asarray(T_ambient, dtype=float))
+    T_exhaust, rh_exhaust = calculate(T_ambient, rh_ambient,
+                                      cooler_efficiency * np.asarray(pump))
+    if kelvin:
+        T_exhaust = cm.c2k(T_exhaust)
+    return T_exhaust, rh_exhaust
+
+
+@profiled
+def simulate(T_exhaust, rh_exhaust, vol_exhaust, T_house, rh_house, v_house):
+    '''
+    Step the house through the exhaust sequence.
+
+    Parameters
+    ----------
+    T_exhaust, rh_exhaust :
+        arrays (..., t) of cooler output per step
+    vol_exhaust :
+        exhaust volume per step, broadcast to (..., t)
+    T_house, rh_house, v_house :
+        starting conditions, broadcast to the batch shape (...)
+
+    Returns
+    -------
+    (T, rh) arrays (..., t) of the house after each step.
+    '''
+    if _backend is not None:
+        return _backend.simulate(T_exhaust, rh_exhaust, vol_exhaust,
+                                 T_house, rh_house, v_house)
+    T_exhaust, rh_exhaust, vol_exhaust = np.broadcast_arrays(
+        T_exhaust, rh_exhaust, np.asarray(vol_exhaust, dtype=float))
+    batch, t = T_exhaust.shape[:-1], T_exhaust.shape[-1]
+    T_out  = np.empty(T_exhaust.shape)
+    rh_out = np.empty(T_exhaust.shape)
+    T  = np.broadcast_to(np.asarray(T_house, dtype=float), batch)
+    rh = np.broadcast_to(np.asarray(rh_house, dtype=float), batch)
+    v_house = np.asarray(v_house, dtype=float)
+    for i in range(t):
+        # house.remove(exhaust.vol); house.mix(exhaust)
+        vol  = vol_exhaust[..., i]
+        keep = v_house - vol
+        tvol = keep + vol
+        rh = (rh * keep + rh_exhaust[..., i] * vol) / tvol
+        T  = (T  * keep + T_exhaust[..., i]  * vol) / tvol
+        T_out[..., i]  = T
+        rh_out[..., i] = rh
+    return T_out, rh_out
+
+
+def mode_settings(modes, v_dot_air):
+    '''
+    Turn a mode table into arrays. Each entry has a 'pump' setting and
+    either a 'fan' index into v_dot_air or its own 'flow', so variable
+    speed fans can list as many airflow levels as they like.
+
+    Returns
+    -------
+    (names, flow, pump) with flow and pump arrays of length len(modes).
+    '''
+    names = list(modes)
+    flow = np.array([modes[m]['flow'] if 'flow' in modes[m]
+                     else v_dot_air[modes[m]['fan']] for m in names], dtype=float)
+    pump = np.array([modes[m]['pump'] for m in names], dtype=float)
+    return names, flow, pump
+
+
+@profiled
+def simulate_modes(modes, t, T_ambient, rh_ambient, T_house, rh_house,
+                   v_dot_air, v_house, dt = 15, cooler_efficiency = 0.744,
+                   site = None, kelvin = False):
+    '''
+    Forecast every mode of the table at once. The forecasts may carry
+    leading batch dimensions (..., t) and the house state (...), the
+    mode axis is added just before the time axis. site is an optional
+    site_model.Site for the cooler psychrometrics, one site or one per
+    leading batch entry. kelvin as for exhaust_conditions: the house,
+    ambient and exhaust temperatures are all kelvin.
+
+    Returns
+    -------
+    (names, ForecastResult) with house and exhaust arrays of shape
+    (..., len(modes), t).
+    '''
+    names, flow, pump = mode_settings(modes, v_dot_air)
+    T_ambient  = expand_forecast(T_ambient, t)
+    rh_ambient = expand_forecast(rh_ambient, t)
+
+    T_exhaust, rh_exhaust = exhaust_conditions(
+        T_ambient[..., None, :], rh_ambient[..., None, :], pump[:, None],
+        cooler_efficiency, None if site is None else site.expand(), kelvin)
+    T_in, rh_in = simulate(T_exhaust, rh_exhaust, flow[:, None] * dt,
+                           np.asarray(T_house, dtype=float)[..., None],
+                           np.asarray(rh_house, dtype=float)[..., None],
+                           np.asarray(v_house, dtype=float)[..., None])
+    return names, ForecastResult(np.arange(t), T_ambient, rh_ambient,
+                                 T_exhaust, rh_exhaust, T_in, rh_in)
+
+
+def mode_resources(result, flow, pump, dt = 15, rho_air = 1.2,
+                   fan_power = 500.0, pump_power = 40.0, seconds_per_unit = 1.0):
+    '''
+    Water and electricity used by each mode of a simulate_modes result,
+    from the exhaust already computed in the same batch.
+
+    Parameters
+    ----------
+    result :
+        ForecastResult with (..., modes, t) exhaust arrays
+    flow, pump :
+        per mode air flow and pump setting, see mode_settings
+    dt :
+        time step in the time unit of flow, the same dt simulate_modes
+        used (it moves flow * dt of air per step)
+    rho_air :
+        air density in kg per unit of flow volume
+    fan_power :
+        fan power in watts at the highest flow, other flows follow the
+        fan affinity law (power ~ flow**3)
+    pump_power :
+        pump power in watts
+    seconds_per_unit :
+        length of the time unit of flow and dt in seconds, 1 for flows
+        per second (v_dot_air in ft**3/s or m**3/s), 60 per minute
+
+    Returns
+    -------
+    (water, energy) arrays (..., modes) in kg and kWh over the forecast.
+    '''
+    # kg of air through the cooler per step, the rate formula is linear
+    # in the air mass so this gives kg of water per step
+    air = (flow * dt * rho_air)[:, None]
+    evaporation = cm.calculate_evaporation_rate(result.T_amb[..., None, :], result.T_ext, air)
+    water = np.clip(evaporation, 0, None).sum(axis=-1)
+    top = flow.max() if flow.max() > 0 else 1.0
+    watts = fan_power * (flow / top)**3 + pump_power * pump
+    energy = watts * dt * seconds_per_unit * result.T_ext.shape[-1] / 3.6e6
+    return water, np.broadcast_to(energy, water.shape)
+
+
+if os.environ.get('COOLER_BACKEND'):
+    use_backend(os.environ['COOLER_BACKEND'])
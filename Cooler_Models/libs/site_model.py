@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Altitude aware psychrometrics with the pressure dependent constants
+computed once per site.
+
+cooler_model.U defaults to sea level pressure and the house models use
+sea level air density, at 1,300+ m both are off by about 15 %. A Site
+takes the station pressure or the elevation (e.g. from a weather.gov
+forecast) and exposes the vectorized cooler_model API with its own
+pressure. The outlet temperature is the sea level Abdel-Fadeel value
+shifted by how much the wet bulb, solved from the ambient rh, moves
+between sea level and the site pressure, so Site(elevation=0) gives
+exactly cooler_model.calculate_outlet_temp_batch. Lower pressure lowers
+the wet bulb at a given rh, so at 1,400 m the outlet is about 0.7 C
+cooler than at sea level (35 C, 20 %). Many sites can be held in one
+Site: their constants get a trailing axis, so inputs shaped (sites, n)
+broadcast against them, see expand() for inputs with more axes.
+
+Temperatures are celcius like cooler_model. The forecasts and
+score_modes take a site= argument, see simulation.exhaust_conditions
+and final_model.score_modes.
+"""
+
+import copy
+import json
+import numpy as np
+from . import cooler_model as cm
+
+R_DRY_AIR = 287.05 # J/kg kelvin
+
+
+def pressure_from_elevation(elevation):
+    ''' standard atmosphere station pressure in millibars, elevation in m '''
+    return 1013.25 * (1 - 2.25577e-5 * np.asarray(elevation, dtype=float)) ** 5.25588
+
+
+def elevation_from_file(path):
+    '''
+    elevation in m from a weather.gov json document that carries one
+    (the hourly forecast has properties.elevation)
+    '''
+    with open(path) as f:
+        elevation = json.load(f)['properties']['elevation']
+    value = float(elevation['value'])
+    if elevation.get('unitCode', 'unit:m').endswith('ft'):
+        value *= 0.3048
+    return value
+
+
+class Site():
+    def __init__(self, elevation = None, pressure = None):
+        '''
+        elevation in m or pressure in millibars, scalar or one per site
+        '''
+        if pressure is None:
+            pressure = pressure_from_elevation(0 if elevation is None else elevation)
+        pressure = np.asarray(pressure, dtype=float)
+        self.elevation = elevation
+        # sites along a trailing axis so (sites, n) inputs broadcast
+        self._set_pressure(pressure[..., None] if pressure.ndim else pressure)
+
+    def _set_pressure(self, pressure):
+        self.pressure = pressure
+        ## NASA TN D-8401 eq 24, (f+g*tw)*p split into two constants
+        self._fp = 6.6e-4 * self.pressure
+        self._gp = 7.570e-7 * self.pressure
+
+    def expand(self, axes = 1):
+        ''' the same sites with axes more trailing axes, for inputs that
+        carry axes between the site and the time axis, e.g. the mode axis
+        of simulation.simulate_modes (sites, modes, t) '''
+        site = copy.copy(self)
+        if self.pressure.ndim:
+            site._set_pressure(self.pressure.reshape(self.pressure.shape + (1,) * axes))
+        return site
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(elevation=elevation_from_file(path))
+
+    def air_density(self, T = 288.15):
+        ''' dry air density kg/m**3 at temperature T kelvin '''
+        return self.pressure * 100 / (R_DRY_AIR * np.asarray(T, dtype=float))
+
+    def density_ratio(self):
+        ''' air density relative to sea level at the same temperature, to
+        scale a sea level density given in any unit '''
+        return self.air_density() / Site().air_density()
+
+    def U(self, ta, tw):
+        ''' cooler_model.U_batch at the site pressure, kelvin in, decimal out '''
+        ta = np.asarray(ta, dtype=float)
+        tw = np.asarray(tw, dtype=float)
+        return (cm._saturation_term(tw) - (self._fp + self._gp * tw) * (ta-tw)) \
+            / cm._saturation_term(ta)
+
+    def calculate_outlet_temp(self, t_amb, rh, efficiency = 0.75):
+        ''' cooler_model.calculate_outlet_temp_batch at the site pressure.
+        t_amb - ambient temperature celcius, rh - relative humidity %.
+        The Abdel-Fadeel wet bulb is shifted by the change of the wet bulb
+        solved from rh between sea level and the site pressure. Raises
+        ValueError where that solve does not converge (e.g. kelvin given
+        for celcius) '''
+        t_amb, rh, efficiency = np.broadcast_arrays(
+            np.asarray(t_amb, dtype=float), np.asarray(rh, dtype=float),
+            np.asarray(efficiency, dtype=float))
+        t_ref = cm.calculate_t_wet_batch(t_amb, rh)
+        tw_site, ok_site = self.calculate_t_wet_from_rh(cm.c2k(t_amb), rh)
+        tw_sea, ok_sea = cm.calculate_t_wet_from_rh(cm.c2k(t_amb), rh)
+        # below 0 C the reference is nan already, keep it that way
+        failed = ~(ok_site & ok_sea) & np.isfinite(t_ref)
+        if np.any(failed):
+            raise ValueError('wet bulb did not converge for {} of {} inputs, '
+                             'is t_amb celcius?'.format(int(failed.sum()), failed.size))
+        t_wet = t_ref + (tw_site - tw_sea)
+        t_exh = t_amb - efficiency * (t_amb - t_wet)
+        rh_exh = cm.U_batch(cm.c2k(t_exh), cm.c2k(t_wet), self.pressure) * 100
+        return(t_exh, rh_exh)
+
+    def calculate_t_wet_from_rh(self, ta, rh, iterations = 4, tol = 1e-6):
+        ''' cooler_model.calculate_t_wet_from_rh at the site pressure '''
+        return cm.calculate_t_wet_from_rh(ta, rh, self.pressure, iterations, tol)
+
+
+if __name__ == '__main__':
+    import os
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', 'Flask-Application', 'tmp', 'weather_forecast.txt')
+    site = Site.from_file(path)
+    print(site.elevation, site.pressure, site.air_density())
+    print(site.calculate_outlet_temp(cm.f2c(100), 20), Site(0).calculate_outlet_temp(cm.f2c(100), 20))
+    sites = Site(elevation=[0, 1400, 2000])
+    print(sites.calculate_outlet_temp(np.full((3, 2), 35.0), 20)[1])
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Multi node RC thermal model of the house: air, interior mass and envelope.
+
+    C_a dT_a/dt = Q (T_exh - T_a) + G_am (T_m - T_a) + G_ae (T_e - T_a)
+    C_m dT_m/dt = G_am (T_a - T_m)
+    C_e dT_e/dt = G_ae (T_a - T_e) + G_eo (T_amb - T_e) + solar
+
+Capacities are expressed as equivalent air volumes and conductances as
+equivalent air flows, so with no mass and envelope coupling the air node
+is the well mixed Environment of the other models (in its continuous
+time limit). With the inputs held over a step the exact discrete time
+transition x' = Ad x + Bd u is computed once per (air flow, dt) with a
+matrix exponential and cached, each step is then one small matrix
+vector product.
+"""
+
+import numpy as np
+from . import simulation as sim
+
+
+def expm(M):
+    ''' matrix exponential by scaling and squaring of a Taylor series,
+    fine for the small, well conditioned matrices used here '''
+    norm = np.max(np.sum(abs(M), axis=1))
+    squarings = max(0, int(np.ceil(np.log2(norm))) + 1) if norm > 0 else 0
+    A = M / 2**squarings
+    result = np.eye(len(M))
+    term = np.eye(len(M))
+    for k in range(1, 20):
+        term = term @ A / k
+        result = result + term
+    for i in range(squarings):
+        result = result @ result
+    return result
+
+
+class ThermalHouse():
+    def __init__(self, v_house, mass_ratio = 4.0, envelope_ratio = 2.0,
+                 g_air_mass = 40.0, g_air_envelope = 15.0, g_envelope_out = 10.0):
+        '''
+        Parameters
+        ----------
+        v_house :
+            air volume, the air node capacity
+        mass_ratio, envelope_ratio :
+            interior mass and envelope capacity as multiples of v_house
+        g_air_mass, g_air_envelope, g_envelope_out :
+            conductances as equivalent air flow, same units as v_dot_air
+        '''
+        self.v_house = v_house
+        self.capacity = np.array((1.0, mass_ratio, envelope_ratio)) * v_house
+        self.g_air_mass = g_air_mass
+        self.g_air_envelope = g_air_envelope
+        self.g_envelope_out = g_envelope_out
+        self._transitions = {}
+
+    def continuous(self, flow):
+        '''
+        A (3, 3) and B (3, 3) of dx/dt = A x + B u for a cooler air flow,
+        x = (T_air, T_mass, T_envelope), u = (T_exhaust, T_ambient, solar)
+        '''
+        g_am, g_ae, g_eo = self.g_air_mass, self.g_air_envelope, self.g_envelope_out
+        A = np.array(((-flow - g_am - g_ae, g_am,  g_ae),
+                      (g_am,               -g_am,  0.0),
+                      (g_ae,                0.0,  -g_ae - g_eo)))
+        B = np.array(((flow, 0.0,  0.0),
+                      (0.0,  0.0,  0.0),
+                      (0.0,  g_eo, 1.0)))
+        return A / self.capacity[:, None], B / self.capacity[:, None]
+
+    def transition(self, flow, dt):
+        ''' cached exact (Ad, Bd) for inputs held constant over dt '''
+        key = (float(flow), float(dt))
+        if key not in self._transitions:
+            A, B = self.continuous(flow)
+            n, m = B.shape
+            M = np.zeros((n + m, n + m))
+            M[:n, :n] = A
+            M[:n, n:] = B
+            E = expm(M * dt)
+            self._transitions[key] = (E[:n, :n], E[:n, n:])
+        return self._transitions[key]
+
+    def forecast_inside_conditions(self, t, fan, pump, T_ambient, rh_ambient,
+                                   T_house, rh_house, v_dot_air, v_house = None,
+                                   dt = 15, cooler_efficiency = 0.744,
+                                   T_mass = None, T_envelope = None, solar = 0.0):
+        '''
+        Same interface as final_model.forecast_inside_conditions. The model
+        keeps its own volume, a v_house that differs from it raises
+        ValueError. Mass and envelope start
+        at T_house unless given, solar is the (forecast of) heat gain on
+        the envelope. Returns a simulation.ForecastResult.
+        '''
+        if v_house is not None and not np.isclose(v_house, self.v_house):
+            raise ValueError('v_house {} differs from the model volume {}'
+                             .format(v_house, self.v_house))
+        T_ambient  = sim.expand_forecast(T_ambient, t)
+        rh_ambient = sim.expand_forecast(rh_ambient, t)
+        solar = sim.expand_forecast(solar, t)
+        T_exhaust, rh_exhaust = sim.exhaust_conditions(T_ambient, rh_ambient, pump, cooler_efficiency)
+
+        flow = v_dot_air[fan]
+        Ad, Bd = self.transition(flow, dt)
+        u = np.stack((T_exhaust, T_ambient, solar), axis=1)
+        x = np.array((T_house,
+                      T_house if T_mass is None else T_mass,
+                      T_house if T_envelope is None else T_envelope), dtype=float)
+        states = np.empty((t, 3))
+        for i in range(t):
+            x = Ad @ x + Bd @ u[i]
+            states[i] = x
+
+        # humidity only follows the air exchange
+        keep = np.exp(-flow * dt / self.v_house)
+        rh = np.empty(t)
+        r = float(rh_house)
+        for i in range(t):
+            r = keep * r + (1 - keep) * rh_exhaust[i]
+            rh[i] = r
+
+        result = sim.ForecastResult(np.arange(t), T_ambient, rh_ambient,
+                                    T_exhaust, rh_exhaust, states[:, 0], rh)
+        result.T_mass = states[:, 1]
+        result.T_envelope = states[:, 2]
+        return result
+
+
+if __name__ == '__main__':
+    from . import cooler_model as cm
+    house = ThermalHouse(250)
+    T_ambient = cm.f2c(np.array([95, 97, 99, 100, 100, 99, 97, 95]))
+    result = house.forecast_inside_conditions(8, 2, 1, T_ambient, 20, cm.f2c(85), 30,
+                                              (0, 2 * 60, 3 * 60), dt=60)
+    print(cm.c2f(result.T_house))
+    print(cm.c2f(result.T_mass))
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Scenario sweep over cooler and house parameters.
+
+Every combination of the parameter grids is scored with the batched mode
+simulation used by get_auto_setting, spread over a process pool, and the
+rows are collected as the workers finish. Output is columnar by default:
+an .npz of one numpy array per column, or parquet for .parquet file names
+(needs pyarrow, a missing pyarrow is an error, not a fallback). Name the
+file .csv for row-wise text.
+
+example:
+    python -m Cooler_Models.sweep --house-vol 8000 10000 12000 --efficiency 0.6 0.7 0.8
+                                  --setpoint 72 75 78 -o sweep.npz
+"""
+
+import os
+
+import argparse
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import numpy as np
+from .libs import cooler_model as cm
+from .libs import simulation as sim
+from .libs.nws_forecast import load_forecast
+
+DEFAULT_FORECAST = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'Flask-Application', 'tmp', 'weather_forecast.txt'))
+
+# modes considered by get_auto_setting
+SWEEP_MODES = {m: sim.MODES[m] for m in sim.MODES if m != 'Pump'}
+
+PARAMETERS = ('forecast', 'house_vol', 'fan_lo', 'fan_hi', 'efficiency', 'setpoint')
+
+
+@lru_cache(maxsize=None)
+def _forecast(path):
+    _, T, rh = load_forecast(path)
+    return T, rh
+
+
+def run_scenarios(scenarios, steps, dt, house_temp, house_rh):
+    '''
+    Score every mode for each scenario, scenarios is a list of dicts
+    with the PARAMETERS keys. Returns a list of result rows (dicts).
+    '''
+    rows = []
+    names = list(SWEEP_MODES)
+    for s in scenarios:
+        T_ambient, rh_ambient = _forecast(s['forecast'])
+        desired_temp = cm.c2k(cm.f2c(s['setpoint']))
+        _, result = sim.simulate_modes(SWEEP_MODES, steps, T_ambient, rh_ambient,
+                                       cm.c2k(cm.f2c(house_temp)), house_rh,
+                                       (0, s['fan_lo'], s['fan_hi']), s['house_vol'],
+                                       dt, s['efficiency'], kelvin=True)
+        scores = ((result.T_house - desired_temp)**2).sum(axis=-1)
+        best = int(np.argmin(scores))
+        row = dict(s)
+        row['best_mode'] = names[best]
+        row['best_score'] = float(scores[best])
+        row['final_T_house'] = float(result.T_house[best, -1])
+        for name, score in zip(names, scores):
+            row['score ' + name] = float(score)
+        rows.append(row)
+    return rows
+
+
+def scenario_grid(args):
+    for values in itertools.product(args.forecast, args.house_vol, args.fan_lo,
+                                    args.fan_hi, args.efficiency, args.setpoint):
+        yield dict(zip(PARAMETERS, values))
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _CsvWriter():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', newline='')
+        self.writer = None
+
+    def write(self, rows):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(rows[0]))
+            self.writer.writeheader()
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter():
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.path = path
+        self.writer = None
+
+    def write(self, rows):
+        table = self.pa.Table.from_pylist(rows)
+        if self.writer is None:
+            self.writer = self.pa.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class _NpzWriter():
+    ''' one array per column, written by numpy when the sweep is done '''
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+
+    def write(self, rows):
+        if self.columns is None:
+            self.columns = {name: [] for name in rows[0]}
+        for name, values in self.columns.items():
+            values.extend(row[name] for row in rows)
+
+    def close(self):
+        if self.columns is not None:
+            np.savez(self.path, **{name: np.array(values)
+                                   for name, values in self.columns.items()})
+
+
+def open_writer(path):
+    ''' writer by file extension: .npz (numpy), .parquet (needs pyarrow,
+    ImportError without it) or .csv '''
+    if path.endswith('.npz'):
+        return _NpzWriter(path)
+    if path.endswith('.parquet'):
+        try:
+            return _ParquetWriter(path)
+        except ImportError as e:
+            raise ImportError('writing {} needs pyarrow, install it or use a '
+                              '.npz or .csv output'.format(path)) from e
+    if path.endswith('.csv'):
+        return _CsvWriter(path)
+    raise ValueError('unknown output format {}, use .npz, .parquet or .csv'.format(path))
+
+
+def sweep(args):
+    writer = open_writer(args.output)
+    count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(run_scenarios, chunk, args.steps, args.dt,
+                                   args.house_temp, args.house_rh)
+                       for chunk in _chunks(scenario_grid(args), args.chunk_size)]
+            for future in as_completed(futures):
+                rows = future.result()
+                writer.write(rows)
+                count += len(rows)
+    finally:
+        writer.close()
+    return count, writer.path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--forecast', nargs='+', default=[DEFAULT_FORECAST],
+                        help='weather.gov hourly forecast json files')
+    parser.add_argument('--house-vol', nargs='+', type=float, default=[10000],
+                        help='house volume ft**3')
+    parser.add_argument('--fan-lo', nargs='+', type=float, default=[70],
+                        help='low fan air flow ft**3/s')
+    parser.add_argument('--fan-hi', nargs='+', type=float, default=[106],
+                        help='high fan air flow ft**3/s')
+    parser.add_argument('--efficiency', nargs='+', type=float, default=[0.744],
+                        help='cooler efficiency in decimal')
+    parser.add_argument('--setpoint', nargs='+', type=float, default=[75],
+                        help='desired house temperature F')
+    parser.add_argument('--house-temp', type=float, default=90,
+                        help='starting house temperature F')
+    parser.add_argument('--house-rh', type=float, default=30,
+                        help='starting house relative humidity %%')
+    parser.add_argument('--steps', type=int, default=4, help='forecast steps')
+    parser.add_argument('--dt', type=float, default=15, help='time step')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes, defaults to the cpu count')
+    parser.add_argument('--chunk-size', type=int, default=256,
+                        help='scenarios per task')
+    parser.add_argument('-o', '--output', default='sweep.npz',
+                        help='.npz (default), .parquet or .csv output file')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    count, path = sweep(parse_args())
+    print('{} scenarios written to {}'.format(count, path))